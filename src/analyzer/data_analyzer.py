@@ -5,7 +5,7 @@ import pathlib
 import time
 import tldextract
 
-from src.utils.utils import get_config, update_config, parse_metadata
+from src.utils.utils import get_cached_config, get_config, update_config, parse_metadata
 from src.utils.db_manager import DBManager
 from cca_core.sentiment_analysis import SentimentAnalyzer
 
@@ -65,12 +65,11 @@ class SentimentAnalysis:
         self.__analyze_sentiment_of_rt_wo_tws(rts_wo_tw)
 
     def __update_sentimient_rts(self, analyzed_tweets):
-        for analyzed_tweet in analyzed_tweets:
-            # search rts of the analyzed tweet
-            rts = self.__dbm.search({'tweet_obj.retweeted_status.id_str': analyzed_tweet['id']})
-            for rt in rts:
-                self.__dbm.update_record({'tweet_obj.id_str': rt['tweet_obj']['id_str']},
-                                         {'sentimiento': analyzed_tweet['sentimiento']})
+        with self.__dbm.buffered_updater() as updater:
+            for analyzed_tweet in analyzed_tweets:
+                # update the relevant rts of the analyzed tweet
+                updater.update_many({'tweet_obj.retweeted_status.id_str': analyzed_tweet['id'], 'relevante': 1},
+                                    {'$set': {'sentimiento': analyzed_tweet['sentimiento']}})
 
     def __analyze_sentiment_of_rt_wo_tws(self, tweets):
         tot_tws = len(tweets)
@@ -116,27 +115,26 @@ class SentimentAnalysis:
                 'tweet_obj.retweeted_status': {'$exists': 0},
                 'sentimiento': {'$exists': 0}
             })
-        tweet_regs = self.__dbm.search(query)
         analyzed_tweets = []
-        tot_reg = tweet_regs.count()
+        tot_reg = self.__dbm.find_all(query).count()
         logging.info('Going to analyze the sentiment of {0} tweets, '
                      'it can take a lot of time, be patient...'.format(tot_reg))
         batch_size = 100
         total_batches = ceil(tot_reg/batch_size)
         batch = 0
-        tweets_to_analyze = []
+        projection = {'tweet_obj.id_str': 1, 'tweet_obj.full_text': 1, 'tweet_obj.text': 1}
+        updater = self.__dbm.buffered_updater()
         try:
-            for current_reg in range(tot_reg):
-                tweet_reg = tweet_regs[current_reg]
-                tweet = tweet_reg['tweet_obj']
-                if 'full_text' in tweet.keys():
-                    tweet_text = tweet['full_text']
-                else:
-                    tweet_text = tweet['text']
-                if len(tweets_to_analyze) < batch_size and current_reg < tot_reg:
+            # each page of tweets is analyzed as a batch
+            for tweet_regs in self.__dbm.iter_pages(query, page_size=batch_size, projection=projection):
+                tweets_to_analyze = []
+                for tweet_reg in tweet_regs:
+                    tweet = tweet_reg['tweet_obj']
+                    if 'full_text' in tweet.keys():
+                        tweet_text = tweet['full_text']
+                    else:
+                        tweet_text = tweet['text']
                     tweets_to_analyze.append({'id': tweet['id_str'], 'text': tweet_text})
-                    if len(tweets_to_analyze) < batch_size:
-                        continue
                 batch += 1
                 logging.info('Analyzing the sentiment of {0} tweets in batch {1}/{2} '
                              'out of {3} tweets...'.format(len(tweets_to_analyze),batch, total_batches, tot_reg))
@@ -144,12 +142,11 @@ class SentimentAnalysis:
                 logging.info('Finished analyzing the sentiment of {0} tweets in batch {1}/{2} '
                              'out of {3} tweets...'.format(len(tweets_to_analyze),batch, total_batches, tot_reg))
                 logging.info('Updating sentiment scores in database...')
-                tweets_to_analyze = []
                 for sentiment_result in sentiment_results:
                     sentiment_info = sentiment_result['sentimiento']
                     tweet_id = sentiment_result['id']
                     tweet_text = sentiment_result['text']
-                    self.__dbm.update_record({'tweet_obj.id_str': tweet_id}, {'sentimiento': sentiment_info})
+                    updater.update_one({'tweet_obj.id_str': tweet_id}, {'sentimiento': sentiment_info})
                     analyzed_tweets.append({
                         'id': tweet_id,
                         'texto': tweet_text,
@@ -161,6 +158,7 @@ class SentimentAnalysis:
         except Exception as e:
             logging.error(e)
         finally:
+            updater.flush()
             self.__update_sentimient_rts(analyzed_tweets)
 
         return analyzed_tweets
@@ -270,6 +268,7 @@ class LinkAnalyzer:
         domains = defaultdict(int)
         logging.info('Extracting the links of {0} tweets...'.format(total_tweets))
         tweet_counter = 0
+        updater = self.db_tweets.buffered_updater()
         for tweet_obj in self.tweets_with_links:
             tweet = tweet_obj['tweet_obj']
             tweet_counter += 1
@@ -303,10 +302,11 @@ class LinkAnalyzer:
                     domains_url[domain_name].append(tweet_url)
                     domains[domain_name] += 1
                     curret_tweet_domains.add(domain_name)
-                self.db_tweets.update_record({'tweet_obj.id_str': tweet['id_str']},
-                                             {'domains': list(curret_tweet_domains)})
+                updater.update_one({'tweet_obj.id_str': tweet['id_str']},
+                                   {'domains': list(curret_tweet_domains)})
             else:
                 logging.info('Tweet without entities {0}'.format(tweet))
+        updater.flush()
         if save_to_file:
             # Save results into a json file
             file_name = pathlib.Path(__file__).parents[2].joinpath('reports', 'tweet_domains.json')
@@ -453,7 +453,7 @@ class UserPoliticalPreference:
     def __get_hashtags_and_metadata(self):
         script_parent_dir = pathlib.Path(__file__).parents[1]
         config_fn = script_parent_dir.joinpath('config.json')
-        configuration = get_config(config_fn)
+        configuration = get_cached_config(config_fn)
         keywords, metadata = parse_metadata(configuration['metadata'])
         hashtags = []
         for keyword in keywords:
@@ -566,47 +566,49 @@ class UserPoliticalPreference:
         tweet_authors = defaultdict(dict)
         total_tweets = tweets.count()
         tweet_counter = 0
-        for tweet in tweets:
-            tweet_counter += 1
-            logging.info('Processing {0}/{1} tweets'.format(tweet_counter, total_tweets))
-            tweet_obj = tweet['tweet_obj']
-            new_fields = {}
-            if tweet_obj['user']['screen_name'] not in tweet_authors.keys():
-                user = self.db_users.search({'screen_name': tweet_obj['user']['screen_name']})
-                try:
-                    new_fields['author_party'] = user[0]['party']
-                except IndexError:
-                    new_fields['author_party'] = None
-                if include_movement:
+        with self.db_tweets.buffered_updater() as updater:
+            for tweet in tweets:
+                tweet_counter += 1
+                logging.info('Processing {0}/{1} tweets'.format(tweet_counter, total_tweets))
+                tweet_obj = tweet['tweet_obj']
+                new_fields = {}
+                if tweet_obj['user']['screen_name'] not in tweet_authors.keys():
+                    user = self.db_users.search({'screen_name': tweet_obj['user']['screen_name']})
                     try:
-                        new_fields.update({'author_movement': user[0]['movement']})
+                        new_fields['author_party'] = user[0]['party']
                     except IndexError:
-                        new_fields.update({'author_movement': None})
-                tweet_authors[tweet_obj['user']['screen_name']] = new_fields
-            else:
-                new_fields = tweet_authors[tweet_obj['user']['screen_name']]
-            self.db_tweets.update_record({'tweet_obj.id_str': tweet_obj['id_str']}, new_fields)
+                        new_fields['author_party'] = None
+                    if include_movement:
+                        try:
+                            new_fields.update({'author_movement': user[0]['movement']})
+                        except IndexError:
+                            new_fields.update({'author_movement': None})
+                    tweet_authors[tweet_obj['user']['screen_name']] = new_fields
+                else:
+                    new_fields = tweet_authors[tweet_obj['user']['screen_name']]
+                updater.update_one({'tweet_obj.id_str': tweet_obj['id_str']}, new_fields)
 
     def update_tweet_user_pbb(self):
         tweets = self.db_tweets.search({})
         tweet_authors = defaultdict(dict)
         total_tweets = tweets.count()
         tweet_counter = 0
-        for tweet in tweets:
-            tweet_counter += 1
-            logging.info('Processing {0}/{1} tweets'.format(tweet_counter, total_tweets))
-            tweet_obj = tweet['tweet_obj']
-            new_fields = {}
-            if tweet_obj['user']['screen_name'] not in tweet_authors.keys():
-                user = self.db_users.search({'screen_name': tweet_obj['user']['screen_name']})
-                try:
-                    new_fields['author_pbb'] = user[0]['bot_analysis']['pbb']
-                except IndexError:
-                    new_fields['author_party'] = -1
-                tweet_authors[tweet_obj['user']['screen_name']] = new_fields
-            else:
-                new_fields = tweet_authors[tweet_obj['user']['screen_name']]
-            self.db_tweets.update_record({'tweet_obj.id_str': tweet_obj['id_str']}, new_fields)
+        with self.db_tweets.buffered_updater() as updater:
+            for tweet in tweets:
+                tweet_counter += 1
+                logging.info('Processing {0}/{1} tweets'.format(tweet_counter, total_tweets))
+                tweet_obj = tweet['tweet_obj']
+                new_fields = {}
+                if tweet_obj['user']['screen_name'] not in tweet_authors.keys():
+                    user = self.db_users.search({'screen_name': tweet_obj['user']['screen_name']})
+                    try:
+                        new_fields['author_pbb'] = user[0]['bot_analysis']['pbb']
+                    except IndexError:
+                        new_fields['author_party'] = -1
+                    tweet_authors[tweet_obj['user']['screen_name']] = new_fields
+                else:
+                    new_fields = tweet_authors[tweet_obj['user']['screen_name']]
+                updater.update_one({'tweet_obj.id_str': tweet_obj['id_str']}, new_fields)
 
 
 if __name__ == '__main__':
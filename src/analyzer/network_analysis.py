@@ -149,6 +149,7 @@ class NetworkAnalyzer:
         users_count = len(users)
         logging.info('::. Network Analyzer: Extracted {0} unique users from the database...'.format(users_count))
         progress = 1
+        upp = UserPoliticalPreference()
         for user in users:
             db_user = {
                 'screen_name': user['screen_name'],
@@ -189,7 +190,6 @@ class NetworkAnalyzer:
 
             # Assign the party and movement to the party and movement that are more related to the user
             # counting both Hashtags and Mentions by the user
-            upp = UserPoliticalPreference()
             user_party = upp.get_user_political_party(user['screen_name'])
             user_movement = upp.get_user_political_movement(user['screen_name'])
             db_user.update({'party': user_party, 'movement': user_movement})
@@ -3,6 +3,9 @@ import logging
 import click
 import os
 import sys
+import time
+
+from collections import defaultdict
 
 # Add the directory to the sys.path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -10,9 +13,19 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from src.analyzer.network_analysis import NetworkAnalyzer
 from src.analyzer.data_analyzer import SentimentAnalysis
+from src.tweet_collector.add_flags import KeywordCatalog
+from src.tweet_collector.checkpoints import KeywordCheckpoints
+from src.tweet_collector.collection_metrics import CollectionMetrics
+from src.tweet_collector.collection_scheduler import CollectionScheduler
+from src.tweet_collector.query_planner import plan_queries
+from src.tweet_collector.tweet_id_filter import TweetIdFilter
+from src.tweet_collector.tweet_ingester import ingest_file
 from src.tweet_collector.twitter_api_manager import TwitterAPIManager
-from src.utils.db_manager import DBManager
-from src.utils.data_wrangler import TweetEvaluator, add_complete_text_attr, add_tweet_type_attr
+from pymongo.errors import BulkWriteError
+from src.utils.db_manager import DBManager, INDEXES
+from src.utils.data_wrangler import TweetEvaluator, add_complete_text_attr, add_flag_arrays_attr, \
+    add_native_dates_attr, add_tweet_type_attr
+from src.utils.sqlite_backend import get_sqlite_database
 from src.utils.utils import get_config, parse_metadata
 
 logging.basicConfig(filename=str(pathlib.Path(__file__).parents[0].joinpath('politic_bots.log')), level=logging.DEBUG)
@@ -24,18 +37,43 @@ def do_tweet_collection():
     configuration = get_config(conf_file)
     credentials = {'key': configuration['twitter']['consumer_key'],
                    'secret': configuration['twitter']['consumer_secret']}
+    # additional apps used to collect tweets concurrently
+    apps_credentials = [credentials] + [{'key': app['consumer_key'], 'secret': app['consumer_secret']}
+                                        for app in configuration['twitter'].get('additional_apps', [])]
+    batch_size = configuration.get('insert_batch_size', 0)
     keyword, k_metadata = parse_metadata(configuration['metadata'])
     dbm = DBManager('tweets')
-    tm = TwitterAPIManager(credentials, dbm)
-    for current_keyword, keyword_row in zip(keyword, k_metadata):
-        logging.info('Searching tweets for %s' % current_keyword)
-        if '@' in current_keyword:
-            tm.search_tweets(configuration['tweets_qry'], current_keyword, 'user', k_metadata)
-        else:
-            tm.search_tweets(configuration['tweets_qry'], current_keyword, 'hashtag', k_metadata)
-    logging.info('Evaluating the relevance of the new tweets...')
-    te = TweetEvaluator()
-    te.identify_relevant_tweets()
+    catalog = KeywordCatalog(k_metadata)
+    checkpoints = KeywordCheckpoints(DBManager('checkpoints'))
+    metrics = CollectionMetrics(configuration.get('progress_interval', 0))
+    id_filter = None
+    if configuration.get('id_filter_file'):
+        id_filter = TweetIdFilter(script_parent_dir.joinpath(configuration['id_filter_file']))
+        id_filter.warm(dbm)
+    # combine keywords into OR queries, 0 means one query per keyword
+    queries = plan_queries(keyword, configuration.get('max_query_length', 0))
+    logging.info('Packed {0} keywords into {1} queries'.format(len(keyword), len(queries)))
+    if len(apps_credentials) > 1:
+        logging.info('Searching tweets with {0} apps'.format(len(apps_credentials)))
+        scheduler = CollectionScheduler(apps_credentials, dbm, configuration['tweets_qry'], catalog, batch_size,
+                                        checkpoints, metrics, id_filter)
+        scheduler.collect(queries)
+    else:
+        tm = TwitterAPIManager(credentials, dbm, batch_size, checkpoints, metrics, id_filter)
+        for query in queries:
+            logging.info('Searching tweets for %s' % query)
+            tm.search_tweets(configuration['tweets_qry'], query, query.keyword_type, catalog)
+    metrics.log_progress(force=True)
+    if id_filter is not None:
+        id_filter.save()
+        id_filter.report()
+    if configuration.get('metrics_file'):
+        metrics.save(script_parent_dir.joinpath(configuration['metrics_file']))
+
+
+def ingest_tweets_file(file_name):
+    logging.info('Ingesting tweets from the file {0}...'.format(file_name))
+    ingest_file(file_name)
 
 
 def do_sentiment_analysis():
@@ -63,17 +101,107 @@ def create_db_users():
     na.create_users_db()
 
 
+def get_representative_queries():
+    # queries that the collector and the analyses run often, built
+    # from documents stored in the collections
+    queries = defaultdict(list)
+    tweet = DBManager('tweets').find_record({'relevante': 1, 'tweet_obj.retweeted_status': {'$exists': 1}})
+    if tweet:
+        tweet_obj = tweet['tweet_obj']
+        queries['tweets'] = [
+            {'tweet_obj.id_str': tweet_obj['id_str']},
+            {'tweet_obj.user.screen_name': tweet_obj['user']['screen_name'], 'relevante': 1},
+            {'tweet_obj.retweeted_status.id_str': tweet_obj['retweeted_status']['id_str']},
+            {'relevante': {'$exists': 0}},
+            {'tweet_py_date': tweet.get('tweet_py_date'), 'relevante': 1},
+            {'extraction_date': {'$in': [tweet['extraction_date']]}, 'relevante': 1}
+        ]
+    user = DBManager('users').find_record({})
+    if user:
+        queries['users'] = [
+            {'screen_name': user['screen_name']},
+            {'bot_analysis': {'$exists': 0}},
+            {'bot_analysis': {'$exists': 1}, 'verified': {'$ne': True}}
+        ]
+    return queries
+
+
+def create_indexes():
+    queries = get_representative_queries()
+    for collection in INDEXES.keys():
+        dbm = DBManager(collection)
+        before = [dbm.explain_query(query) for query in queries[collection]]
+        start = time.time()
+        indexes = dbm.ensure_indexes()
+        logging.info('Created {0} indexes in the collection {1} in {2:.2f} seconds'.
+                     format(len(indexes), collection, time.time()-start))
+        after = [dbm.explain_query(query) for query in queries[collection]]
+        for stats_before, stats_after in zip(before, after):
+            logging.info('Query {0}: {1} secs, {2} docs examined, {3} before creating the indexes; '
+                         '{4} secs, {5} docs examined, {6} after creating them'.
+                         format(stats_before['query'], stats_before['secs'], stats_before['docs_examined'],
+                                stats_before['plan'], stats_after['secs'], stats_after['docs_examined'],
+                                stats_after['plan']))
+            if 'COLLSCAN' in stats_after['plan']:
+                logging.warning('Query {0} still scans the whole collection {1}'.format(stats_after['query'],
+                                                                                     collection))
+
+
+def create_sqlite_snapshot(file_name, page_size=1000):
+    # copy the collections of MongoDB into a SQLite file that can be
+    # used as storage backend of the analyses (storage.backend: sqlite)
+    config = get_config(pathlib.Path(__file__).parents[0].joinpath('config.json'))
+    if config.get('storage', {}).get('backend', 'mongodb') != 'mongodb':
+        raise click.UsageError('The snapshot is copied from MongoDB, set storage.backend to mongodb to create it')
+    snapshot = get_sqlite_database(file_name)
+    for collection in INDEXES.keys():
+        start = time.time()
+        target = snapshot[collection]
+        for index in INDEXES[collection]:
+            target.create_index(index['keys'], **index.get('options', {}))
+        num_docs = 0
+        for page in DBManager(collection).iter_pages(page_size=page_size):
+            try:
+                num_docs += len(target.insert_many(page, ordered=False).inserted_ids)
+            except BulkWriteError as e:
+                # documents copied by a previous snapshot are skipped
+                num_docs += e.details['nInserted']
+        logging.info('Copied {0} documents of the collection {1} to {2} in {3:.2f} seconds'.
+                     format(num_docs, collection, file_name, time.time()-start))
+
+
+def export_columnar_snapshot(output_dir):
+    # imported here so that the other tasks don't need pyarrow
+    from src.utils.snapshot_exporter import SnapshotExporter
+    exporter = SnapshotExporter(output_dir)
+    num_docs = exporter.export()
+    logging.info('Exported {0} tweets and {1} users to {2}'.format(num_docs['tweets'], num_docs['users'], output_dir))
+
+
 @click.command()
 @click.option('--collect_tweets', help='Collect tweets', default=False, is_flag=True)
+@click.option('--ingest_file', help='Load tweets from a JSON lines file (optionally gzipped)', default='')
 @click.option('--sentiment_analysis', help='Analyze the sentiment of tweets', default=False, is_flag=True)
 @click.option('--interaction_net', help='Generate the interaction network', default=False, is_flag=True)
 @click.option('--flag_tweets', help='Identify and flag relevant tweets', default=False, is_flag=True)
 @click.option('--db_users', help='Create a database of users', default=False, is_flag=True)
 @click.option('--add_complete_text', help='Add attribute complete text', default=False, is_flag=True)
 @click.option('--add_type', help='Add attribute complete text', default=False, is_flag=True)
-def run_task(collect_tweets, sentiment_analysis, interaction_net, flag_tweets, db_users, add_complete_text, add_type):
+@click.option('--add_flag_arrays', help='Add the arrays of parties, movements and candidates flagged in the tweets',
+              default=False, is_flag=True)
+@click.option('--add_native_dates', help='Add the publication and extraction dates of the tweets as datetimes',
+              default=False, is_flag=True)
+@click.option('--create_indexes', 'indexes', help='Create the indexes of the collections', default=False,
+              is_flag=True)
+@click.option('--sqlite_snapshot', help='Copy the collections into a SQLite file', default='')
+@click.option('--export_snapshot', help='Export tweets and users to Parquet datasets in the given directory',
+              default='')
+def run_task(collect_tweets, ingest_file, sentiment_analysis, interaction_net, flag_tweets, db_users, add_complete_text,
+             add_type, add_flag_arrays, add_native_dates, indexes, sqlite_snapshot, export_snapshot):
     if collect_tweets:
         do_tweet_collection()
+    elif ingest_file:
+        ingest_tweets_file(ingest_file)
     elif sentiment_analysis:
         do_sentiment_analysis()
     elif flag_tweets:
@@ -86,6 +214,16 @@ def run_task(collect_tweets, sentiment_analysis, interaction_net, flag_tweets, d
         add_complete_text_attr()
     elif add_type:
         add_tweet_type_attr()
+    elif add_flag_arrays:
+        add_flag_arrays_attr()
+    elif add_native_dates:
+        add_native_dates_attr()
+    elif indexes:
+        create_indexes()
+    elif sqlite_snapshot:
+        create_sqlite_snapshot(sqlite_snapshot)
+    elif export_snapshot:
+        export_columnar_snapshot(export_snapshot)
     else:
         click.UsageError('Illegal user: Please indicate a running option. Type --help for more information of '
                          'the available options')
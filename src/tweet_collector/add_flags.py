@@ -29,6 +29,23 @@ def create_flag(metadata):
     return flags, headers
 
 
+# flags that are also stored as arrays with the values mentioned in the tweet,
+# unlike the keys of the flags dictionary, the arrays can be indexed
+FLAG_ARRAYS = {'partido_politico': 'flag_parties', 'movimiento': 'flag_movements', 'candidatura': 'flag_candidates'}
+
+
+def get_flag_arrays(flags):
+    """
+    get_flag_arrays lists the parties, movements and candidates
+    mentioned in a tweet according to its flags
+
+    :param flags: dictionary of flags of the tweet
+    :return: dictionary with the arrays of FLAG_ARRAYS
+    """
+    return {array_name: [value for value, count in flags.get(flag_name, {}).items() if count > 0]
+            for flag_name, array_name in FLAG_ARRAYS.items()}
+
+
 def do_get_entities_tweet(tweet):
     entities = set()
     hashtags = tweet['entities']['hashtags']
@@ -78,7 +95,68 @@ def add_values_to_flags(flags, entities, metadata):
                         flags[k].append(entity)
                     elif v != '':
                         flags[k][v] += 1
-    return {'flag': flags}
+    flag = {'flag': flags}
+    flag.update(get_flag_arrays(flags))
+    return flag
+
+
+class KeywordCatalog:
+    """
+    KeywordCatalog precompiles the keyword metadata so that flagging a tweet
+    costs one dictionary lookup per entity instead of a scan over every row
+    of metadata. It also keeps the flag template created by create_flag, which
+    is copied for each tweet rather than rebuilt from the metadata.
+
+    :param metadata: list of rows (dictionaries) as returned by parse_metadata
+    """
+    def __init__(self, metadata):
+        self.metadata = metadata
+        self.template, self.headers = create_flag(metadata)
+        # keywords indexed by their lowercase form (e.g., hashtags) and
+        # user handlers indexed by their exact form (e.g., @ANRParaguay),
+        # these are the two ways add_values_to_flags matches an entity
+        self.__lower_index = defaultdict(list)
+        self.__handler_index = defaultdict(list)
+        for idx, row in enumerate(metadata):
+            # keep only the values that add_values_to_flags writes
+            values = [(k, v) for k, v in row.items() if k != 'keyword' and v != '']
+            self.__lower_index[row['keyword'].lower()].append((idx, values))
+            if row['keyword'].startswith('@'):
+                self.__handler_index[row['keyword']].append((idx, values))
+
+    def new_flag(self):
+        # copy the template, its values are either dictionaries of counters
+        # or the list of keywords
+        return {k: v.copy() if isinstance(v, dict) else list(v) for k, v in self.template.items()}
+
+    def __get_rows(self, entity):
+        lower_rows = self.__lower_index.get(entity.lower(), [])
+        handler_rows = self.__handler_index.get('@'+entity, [])
+        if lower_rows and handler_rows:
+            # respect the order of the metadata as add_values_to_flags does
+            return sorted(lower_rows + handler_rows, key=lambda idx_values: idx_values[0])
+        return lower_rows or handler_rows
+
+    def add_values_to_flags(self, flags, entities):
+        """
+        Same as the function add_values_to_flags but using the index of the catalog
+
+        :param flags: dictionary of flags created by new_flag
+        :param entities: hashtags and mentions available in the tweet
+        :return: dictionary of flags to be used to augment the tweet object
+        """
+        for entity in entities:
+            for _, values in self.__get_rows(entity):
+                flags['keyword'].append(entity)
+                for k, v in values:
+                    flags[k][v] += 1
+        flag = {'flag': flags}
+        flag.update(get_flag_arrays(flags))
+        return flag
+
+    def flag_tweet(self, tweet):
+        entities = get_entities_tweet(tweet)
+        return self.add_values_to_flags(self.new_flag(), entities)
 
 # if __name__ == '__main__':
 #
@@ -0,0 +1,56 @@
+import logging
+import pathlib
+
+
+logging.basicConfig(filename=str(pathlib.Path(__file__).parents[1].joinpath('politic_bots.log')), level=logging.DEBUG)
+
+
+class KeywordCheckpoints:
+    """
+    Record, per keyword, the ids of the tweets already downloaded so that
+    searches only fetch new tweets and interrupted searches resume where
+    they stopped. The search API returns tweets from the newest to the oldest,
+    so for each keyword the following ids are saved
+
+    - since_id: the newest tweet downloaded by the last complete search
+    - max_id: the oldest tweet downloaded by the search in progress
+    - run_newest_id: the newest tweet downloaded by the search in progress
+
+    :param db: DBManager of the collection where the checkpoints are saved
+    """
+    def __init__(self, db):
+        self.db = db
+
+    def get(self, keyword):
+        checkpoint = self.db.find_record({'keyword': keyword})
+        return checkpoint if checkpoint else {}
+
+    def cursor_params(self, keyword):
+        """
+        Get the since_id and max_id parameters of the next search of the keyword
+        """
+        checkpoint = self.get(keyword)
+        params = {}
+        if checkpoint.get('since_id'):
+            params['since_id'] = checkpoint['since_id']
+        if checkpoint.get('max_id'):
+            # the search was interrupted, continue from the
+            # tweet previous to the oldest downloaded one
+            params['max_id'] = checkpoint['max_id'] - 1
+        return params
+
+    def save_progress(self, keyword, oldest_id, newest_id):
+        checkpoint = self.get(keyword)
+        new_values = {
+            'max_id': oldest_id,
+            'run_newest_id': max(newest_id, checkpoint.get('run_newest_id', 0))
+        }
+        self.db.update_record({'keyword': keyword}, new_values, create_if_doesnt_exist=True)
+
+    def complete(self, keyword):
+        checkpoint = self.get(keyword)
+        if 'run_newest_id' in checkpoint:
+            since_id = max(checkpoint['run_newest_id'], checkpoint.get('since_id', 0))
+            self.db.update_record({'keyword': keyword}, {'since_id': since_id})
+            self.db.remove_field({'keyword': keyword}, {'max_id': 1, 'run_newest_id': 1})
+            logging.info('Checkpoint of {0} moved to the tweet {1}'.format(keyword, since_id))
@@ -0,0 +1,143 @@
+import csv
+import json
+import logging
+import pathlib
+import threading
+import time
+
+
+logging.basicConfig(filename=str(pathlib.Path(__file__).parents[1].joinpath('politic_bots.log')), level=logging.DEBUG)
+
+
+class KeywordMetrics:
+    """
+    Counters of the search of a keyword (or packed query)
+    """
+    def __init__(self, keyword):
+        self.keyword = keyword
+        self.start_time = time.time()
+        self.end_time = None
+        self.requests = 0
+        self.api_secs = 0.0
+        self.rate_limit_wait_secs = 0.0
+        self.tweets = 0
+        self.inserted = 0
+        self.duplicated = 0
+        self.filtered = 0
+        self.db_writes = 0
+        self.db_write_secs = 0.0
+        self.max_batch_size = 0
+
+    def add_request(self, api_secs, num_tweets):
+        self.requests += 1
+        self.api_secs += api_secs
+        self.tweets += num_tweets
+
+    def add_rate_limit_wait(self, wait_secs):
+        self.rate_limit_wait_secs += wait_secs
+
+    def add_filtered(self):
+        # duplicated tweet discarded before reaching the database
+        self.filtered += 1
+
+    def add_write(self, write_secs, batch_size, num_inserted, num_duplicated):
+        self.db_writes += 1
+        self.db_write_secs += write_secs
+        self.max_batch_size = max(self.max_batch_size, batch_size)
+        self.inserted += num_inserted
+        self.duplicated += num_duplicated
+
+    def finish(self):
+        self.end_time = time.time()
+
+    def to_dict(self):
+        elapsed_secs = (self.end_time or time.time()) - self.start_time
+        return {
+            'keyword': self.keyword,
+            'requests': self.requests,
+            'tweets': self.tweets,
+            'inserted': self.inserted,
+            'duplicated': self.duplicated,
+            'filtered': self.filtered,
+            'elapsed_secs': round(elapsed_secs, 3),
+            'api_secs': round(self.api_secs, 3),
+            'rate_limit_wait_secs': round(self.rate_limit_wait_secs, 3),
+            'tweets_per_sec': round(self.tweets/elapsed_secs, 3) if elapsed_secs > 0 else 0,
+            'db_writes': self.db_writes,
+            'db_write_secs': round(self.db_write_secs, 3),
+            'avg_db_write_ms': round(1000*self.db_write_secs/self.db_writes, 3) if self.db_writes else 0,
+            'avg_batch_size': round((self.inserted+self.duplicated)/self.db_writes, 1) if self.db_writes else 0,
+            'max_batch_size': self.max_batch_size
+        }
+
+
+class CollectionMetrics:
+    """
+    Metrics of a tweet collection, shared by the apps that collect tweets
+
+    :param progress_interval: seconds between the progress lines written to
+    the log, if 0 no progress line is written
+    """
+    fieldnames = ['keyword', 'requests', 'tweets', 'inserted', 'duplicated', 'filtered', 'elapsed_secs', 'api_secs',
+                  'rate_limit_wait_secs', 'tweets_per_sec', 'db_writes', 'db_write_secs', 'avg_db_write_ms',
+                  'avg_batch_size', 'max_batch_size']
+
+    def __init__(self, progress_interval=0):
+        self.progress_interval = progress_interval
+        self.start_time = time.time()
+        self.__last_progress = self.start_time
+        self.__keywords = []
+        self.__lock = threading.Lock()
+
+    def start_keyword(self, keyword):
+        keyword_metrics = KeywordMetrics(keyword)
+        with self.__lock:
+            self.__keywords.append(keyword_metrics)
+        return keyword_metrics
+
+    def log_progress(self, force=False):
+        now = time.time()
+        with self.__lock:
+            if not force and (self.progress_interval <= 0 or now - self.__last_progress < self.progress_interval):
+                return
+            self.__last_progress = now
+            keywords = list(self.__keywords)
+        finished = sum(1 for keyword_metrics in keywords if keyword_metrics.end_time)
+        tweets = sum(keyword_metrics.tweets for keyword_metrics in keywords)
+        elapsed_secs = now - self.start_time
+        logging.info('Progress: {0} queries finished, {1} in progress, {2} tweets downloaded in {3:.0f} seconds '
+                     '({4:.1f} tweets/sec)'.format(finished, len(keywords)-finished, tweets, elapsed_secs,
+                                                   tweets/elapsed_secs if elapsed_secs > 0 else 0))
+
+    def summary(self):
+        with self.__lock:
+            keywords = [keyword_metrics.to_dict() for keyword_metrics in self.__keywords]
+        elapsed_secs = time.time() - self.start_time
+        total = {'keyword': 'TOTAL', 'elapsed_secs': round(elapsed_secs, 3)}
+        for field in ['requests', 'tweets', 'inserted', 'duplicated', 'filtered', 'api_secs', 'rate_limit_wait_secs',
+                      'db_writes', 'db_write_secs']:
+            total[field] = round(sum(keyword[field] for keyword in keywords), 3)
+        total['tweets_per_sec'] = round(total['tweets']/elapsed_secs, 3) if elapsed_secs > 0 else 0
+        total['avg_db_write_ms'] = round(1000*total['db_write_secs']/total['db_writes'], 3) \
+            if total['db_writes'] else 0
+        total['avg_batch_size'] = round((total['inserted']+total['duplicated'])/total['db_writes'], 1) \
+            if total['db_writes'] else 0
+        total['max_batch_size'] = max([keyword['max_batch_size'] for keyword in keywords] or [0])
+        return {'keywords': keywords, 'total': total}
+
+    def save(self, file_name):
+        """
+        Save the summary of the metrics in a csv file, if the name of
+        the file ends with .csv, or in a json file otherwise
+        """
+        summary = self.summary()
+        with open(str(file_name), 'w', encoding='utf-8') as f:
+            if str(file_name).endswith('.csv'):
+                writer = csv.DictWriter(f, fieldnames=self.fieldnames)
+                writer.writeheader()
+                for keyword in summary['keywords']:
+                    writer.writerow(keyword)
+                writer.writerow(summary['total'])
+            else:
+                json.dump(summary, f, indent=4)
+        logging.info('Saved the metrics of the collection in {0}'.format(file_name))
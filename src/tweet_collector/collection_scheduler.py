@@ -0,0 +1,81 @@
+import logging
+import pathlib
+import queue
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from src.tweet_collector.collection_metrics import CollectionMetrics
+from src.tweet_collector.twitter_api_manager import TwitterAPIManager
+
+
+logging.basicConfig(filename=str(pathlib.Path(__file__).parents[1].joinpath('politic_bots.log')), level=logging.DEBUG)
+
+
+class CollectionScheduler:
+    """
+    Search keywords concurrently using several app credentials. Each
+    credential runs in its own thread and takes the next pending query
+    only while its rate limit budget, which is updated from the headers of
+    the API responses, has requests left. Credentials without capacity wait
+    until their window is renewed while the others keep collecting.
+
+    :param credentials: list of dictionaries with the key and secret of each app
+    :param db: DBManager of the collection where the tweets are saved
+    :param tweets_qry: number of tweets requested per page
+    :param catalog: KeywordCatalog used to flag the tweets
+    :param batch_size: number of tweets to buffer before storing them in bulk
+    :param checkpoints: KeywordCheckpoints shared by the apps
+    :param metrics: CollectionMetrics shared by the apps
+    :param id_filter: TweetIdFilter shared by the apps
+    :param manager_factory: callable that receives the credentials, the db, the
+    batch size, the checkpoints, the metrics and the id filter and returns an object
+    with the interface of TwitterAPIManager, it allows to run the scheduler against
+    a fake api
+    """
+    def __init__(self, credentials, db, tweets_qry, catalog, batch_size=0, checkpoints=None, metrics=None,
+                 id_filter=None, manager_factory=TwitterAPIManager):
+        self.tweets_qry = tweets_qry
+        self.catalog = catalog
+        self.metrics = metrics if metrics else CollectionMetrics()
+        self.managers = [manager_factory(app_credentials, db, batch_size, checkpoints, self.metrics, id_filter)
+                         for app_credentials in credentials]
+        self.__queries = queue.Queue()
+
+    def __collect(self, app_id, manager):
+        searched_queries, downloaded_tweets = 0, 0
+        while True:
+            if not manager.rate_limit.has_capacity():
+                wait_secs = manager.rate_limit.seconds_to_reset() + 1
+                logging.info('App {0} ran out of requests, waiting {1:.0f} seconds'.format(app_id, wait_secs))
+                time.sleep(wait_secs)
+                continue
+            try:
+                query = self.__queries.get_nowait()
+            except queue.Empty:
+                break
+            logging.info('Searching tweets for {0} with app {1}'.format(query, app_id))
+            downloaded_tweets += manager.search_tweets(self.tweets_qry, query, query.keyword_type, self.catalog)
+            searched_queries += 1
+        manager.flush()
+        return searched_queries, downloaded_tweets
+
+    def collect(self, queries):
+        """
+        Search the given queries distributing them among the credentials
+
+        :param queries: list of PackedQuery (see plan_queries)
+        :return: total number of downloaded tweets
+        """
+        for query in queries:
+            self.__queries.put(query)
+        total_tweets = 0
+        with ThreadPoolExecutor(max_workers=len(self.managers)) as executor:
+            futures = [executor.submit(self.__collect, app_id, manager)
+                       for app_id, manager in enumerate(self.managers)]
+            for app_id, future in enumerate(futures):
+                searched_queries, downloaded_tweets = future.result()
+                logging.info('App {0} searched {1} queries and downloaded {2} tweets'.
+                             format(app_id, searched_queries, downloaded_tweets))
+                total_tweets += downloaded_tweets
+        logging.info('Downloaded {0} tweets using {1} apps'.format(total_tweets, len(self.managers)))
+        return total_tweets
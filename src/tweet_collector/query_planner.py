@@ -0,0 +1,81 @@
+from src.tweet_collector.add_flags import get_entities_tweet
+
+
+# maximum length of the queries accepted by the search api
+MAX_QUERY_LENGTH = 500
+
+
+def get_keyword_type(keyword):
+    return 'user' if '@' in keyword else 'hashtag'
+
+
+class PackedQuery:
+    """
+    PackedQuery combines several keywords into a single OR query
+    of the search api
+
+    :param keywords: list of keywords in the order of the metadata file
+    """
+    def __init__(self, keywords):
+        self.keywords = keywords
+        self.query = ' OR '.join(keywords)
+        # type used for tweets that can't be attributed to any keyword
+        self.keyword_type = get_keyword_type(keywords[0])
+        # index the keywords as they are matched in add_values_to_flags
+        self.__lower_index, self.__handler_index = {}, {}
+        for idx, keyword in enumerate(keywords):
+            self.__lower_index.setdefault(keyword.lower(), idx)
+            if keyword.startswith('@'):
+                self.__handler_index.setdefault(keyword, idx)
+
+    def __str__(self):
+        return self.query
+
+    def match_keywords(self, tweet):
+        """
+        Get the keywords of the query that match the hashtags and mentions
+        of the tweet (see get_entities_tweet)
+        """
+        matched = set()
+        for entity in get_entities_tweet(tweet):
+            if entity.lower() in self.__lower_index:
+                matched.add(self.__lower_index[entity.lower()])
+            if '@'+entity in self.__handler_index:
+                matched.add(self.__handler_index['@'+entity])
+        return [self.keywords[idx] for idx in sorted(matched)]
+
+    def keyword_type_of(self, tweet):
+        """
+        Type of the tweet given by the first keyword, in the order of the
+        metadata file, that matches the tweet. This is the type the tweet would
+        get if the keywords were searched one by one
+        """
+        matched_keywords = self.match_keywords(tweet)
+        if matched_keywords:
+            return get_keyword_type(matched_keywords[0])
+        return self.keyword_type
+
+
+def plan_queries(keywords, max_length=MAX_QUERY_LENGTH):
+    """
+    Pack the keywords into OR queries that don't exceed max_length characters.
+    Keywords keep their order, so each query contains consecutive keywords of
+    the metadata file
+
+    :param keywords: list of keywords to search
+    :param max_length: maximum length of the queries, if 0 keywords are not packed
+    :return: list of PackedQuery
+    """
+    queries = []
+    current_keywords, current_length = [], 0
+    for keyword in keywords:
+        # length of the query if the keyword is added, including the operator
+        new_length = current_length + len(' OR ') + len(keyword) if current_keywords else len(keyword)
+        if current_keywords and (max_length <= 0 or new_length > max_length):
+            queries.append(PackedQuery(current_keywords))
+            current_keywords, new_length = [], len(keyword)
+        current_keywords.append(keyword)
+        current_length = new_length
+    if current_keywords:
+        queries.append(PackedQuery(current_keywords))
+    return queries
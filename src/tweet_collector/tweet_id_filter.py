@@ -0,0 +1,134 @@
+import logging
+import numpy as np
+import os
+import pathlib
+import threading
+
+from bson import ObjectId
+
+
+logging.basicConfig(filename=str(pathlib.Path(__file__).parents[1].joinpath('politic_bots.log')), level=logging.DEBUG)
+
+
+class TweetIdFilter:
+    """
+    In-process set of the ids of the tweets already stored, checked before
+    sending a tweet to the database. Ids are kept as a sorted array of int64
+    (8 bytes per tweet) plus a small set of the ids added since the last merge.
+    The set is exact, so it has no false positives and never discards a new
+    tweet; tweets stored by other processes since the filter was warmed are the
+    only duplicates that reach the database, they are reported as misses
+
+    :param file_name: file where the filter is saved between runs
+    :param merge_size: number of new ids kept in the set before merging them
+    into the sorted array
+    """
+    def __init__(self, file_name=None, merge_size=100000):
+        self.file_name = str(file_name) if file_name else None
+        self.merge_size = merge_size
+        self.__ids = np.empty(0, dtype=np.int64)
+        self.__new_ids = set()
+        # id of the last document of the collection included in the filter
+        self.__last_oid = None
+        self.__lock = threading.Lock()
+        self.lookups, self.hits, self.misses = 0, 0, 0
+        if self.file_name and os.path.exists(self.file_name):
+            self.load()
+
+    def __len__(self):
+        return len(self.__ids) + len(self.__new_ids)
+
+    def __merge(self):
+        if self.__new_ids:
+            new_ids = np.fromiter(self.__new_ids, dtype=np.int64, count=len(self.__new_ids))
+            self.__ids = np.union1d(self.__ids, new_ids)
+            self.__new_ids = set()
+
+    def __contains_id(self, tweet_id):
+        if tweet_id in self.__new_ids:
+            return True
+        idx = np.searchsorted(self.__ids, tweet_id)
+        return idx < len(self.__ids) and self.__ids[idx] == tweet_id
+
+    def add(self, tweet_id):
+        with self.__lock:
+            self.__new_ids.add(int(tweet_id))
+            if len(self.__new_ids) >= self.merge_size:
+                self.__merge()
+
+    def __contains__(self, tweet_id):
+        with self.__lock:
+            return self.__contains_id(int(tweet_id))
+
+    def check(self, tweet_id):
+        """
+        Check whether the tweet was already stored. The tweet is not added,
+        ids must be added once their tweets are stored, otherwise a failed
+        write would make the filter skip them in later runs
+
+        :param tweet_id: id (int or str) of the tweet
+        :return: True if the tweet is in the filter
+        """
+        tweet_id = int(tweet_id)
+        with self.__lock:
+            self.lookups += 1
+            if self.__contains_id(tweet_id):
+                self.hits += 1
+                return True
+            return False
+
+    def record_misses(self, num_duplicated):
+        # duplicates that passed the filter and were rejected by the database
+        with self.__lock:
+            self.misses += num_duplicated
+
+    def warm(self, dbm):
+        """
+        Add the ids of the tweets stored in the collection since the last
+        time the filter was warmed
+
+        :param dbm: DBManager of the collection of tweets
+        """
+        query = {'_id': {'$gt': self.__last_oid}} if self.__last_oid else {}
+        docs = dbm.find_all(query, {'_id': 1, 'tweet_obj.id_str': 1})
+        num_docs = 0
+        for doc in docs:
+            num_docs += 1
+            self.add(doc['tweet_obj']['id_str'])
+            if not self.__last_oid or doc['_id'] > self.__last_oid:
+                self.__last_oid = doc['_id']
+        with self.__lock:
+            self.__merge()
+        logging.info('Added {0} tweets to the filter of ids, it contains {1} tweets'.format(num_docs, len(self)))
+
+    def load(self):
+        with np.load(self.file_name) as data:
+            self.__ids = data['ids']
+            self.__last_oid = ObjectId(str(data['last_oid'])) if str(data['last_oid']) else None
+        logging.info('Loaded {0} tweet ids from {1}'.format(len(self.__ids), self.file_name))
+
+    def save(self):
+        with self.__lock:
+            self.__merge()
+            # np.savez adds the extension .npz to names without it
+            with open(self.file_name, 'wb') as f:
+                np.savez(f, ids=self.__ids, last_oid=np.array(str(self.__last_oid) if self.__last_oid else ''))
+        logging.info('Saved {0} tweet ids in {1}'.format(len(self.__ids), self.file_name))
+
+    def report(self):
+        """
+        Get the statistics of the filter. The false positive rate is
+        zero by construction
+        """
+        checked_duplicates = self.hits + self.misses
+        stats = {
+            'ids': len(self),
+            'lookups': self.lookups,
+            'filtered_duplicates': self.hits,
+            'missed_duplicates': self.misses,
+            'false_positive_rate': 0.0,
+            'duplicates_filtered_rate': self.hits/checked_duplicates if checked_duplicates else 0.0,
+            'size_bytes': self.__ids.nbytes
+        }
+        logging.info('Filter of tweet ids: {0}'.format(stats))
+        return stats
@@ -0,0 +1,117 @@
+import gzip
+import json
+import logging
+import os
+import pathlib
+import time
+
+from collections import deque
+from multiprocessing import Pool
+from src.tweet_collector.add_flags import KeywordCatalog
+from src.tweet_collector.query_planner import PackedQuery, get_keyword_type
+from src.utils.data_wrangler import TweetEvaluator
+from src.utils.db_manager import DBManager
+from src.utils.utils import get_config, parse_metadata
+
+
+logging.basicConfig(filename=str(pathlib.Path(__file__).parents[1].joinpath('politic_bots.log')), level=logging.DEBUG)
+
+
+# objects used by the worker processes to enrich the tweets,
+# they are created once per process by __init_worker
+_catalog, _keywords, _evaluator = None, None, None
+
+
+def __init_worker(metadata_file):
+    global _catalog, _keywords, _evaluator
+    keywords, k_metadata = parse_metadata(metadata_file)
+    _catalog = KeywordCatalog(k_metadata)
+    _keywords = PackedQuery(keywords)
+    _evaluator = TweetEvaluator(collection_name=None)
+
+
+def enrich_tweet(tweet, extraction_date):
+    """
+    Build the document of the tweet as the collector does, adding the flags,
+    the type, the dates of publication and the relevance of the tweet
+    """
+    matched_keywords = _keywords.match_keywords(tweet)
+    keyword_type = get_keyword_type(matched_keywords[0]) if matched_keywords else 'hashtag'
+    flag = _catalog.flag_tweet(tweet)
+    relevance = _evaluator.get_tweet_relevance(tweet)
+    return DBManager.create_tweet_record(tweet, keyword_type, extraction_date, flag, relevance)
+
+
+def __enrich_lines(lines):
+    extraction_date = time.strftime('%m/%d/%y')
+    enriched_tweets, discarded_lines = [], 0
+    for line in lines:
+        try:
+            tweet = json.loads(line)
+        except ValueError:
+            discarded_lines += 1
+            continue
+        # skip objects that are not tweets (e.g., delete notices)
+        if not isinstance(tweet, dict) or 'id_str' not in tweet:
+            discarded_lines += 1
+            continue
+        enriched_tweets.append(enrich_tweet(tweet, extraction_date))
+    return enriched_tweets, discarded_lines
+
+
+def __read_chunks(f, chunk_size):
+    chunk = []
+    for line in f:
+        if line.strip():
+            chunk.append(line)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def ingest_file(file_name, collection='tweets', chunk_size=1000, processes=None):
+    """
+    Load the tweets of a file of line-delimited JSON, optionally gzipped,
+    into the database. Lines are parsed and enriched by a pool of processes
+    and stored in bulk; at most two chunks per process are in memory at
+    any time
+
+    :param file_name: name of the file, those ending in .gz are decompressed
+    :param collection: collection where the tweets are saved
+    :param chunk_size: number of lines sent to each process and inserted at once
+    :param processes: number of processes of the pool, by default the number of cpus
+    :return: tuple with the number of inserted, duplicated and discarded tweets
+    """
+    script_parent_dir = pathlib.Path(__file__).parents[1]
+    configuration = get_config(script_parent_dir.joinpath('config.json'))
+    dbm = DBManager(collection)
+    dbm.create_unique_tweet_index()
+    total_inserted, total_duplicated, total_discarded = 0, 0, 0
+    start_time = time.time()
+    processes = processes or os.cpu_count()
+    open_fn = gzip.open if str(file_name).endswith('.gz') else open
+    with open_fn(str(file_name), 'rt', encoding='utf-8') as f, \
+            Pool(processes, initializer=__init_worker, initargs=(configuration['metadata'],)) as pool:
+        pending = deque()
+        chunks = __read_chunks(f, chunk_size)
+        while True:
+            # keep the pool busy without reading the whole file
+            for chunk in chunks:
+                pending.append(pool.apply_async(__enrich_lines, (chunk,)))
+                if len(pending) == 2 * processes:
+                    break
+            if not pending:
+                break
+            enriched_tweets, discarded_lines = pending.popleft().get()
+            num_inserted, num_duplicated = dbm.add_tweets(enriched_tweets)
+            total_inserted += num_inserted
+            total_duplicated += num_duplicated
+            total_discarded += discarded_lines
+    elapsed_secs = time.time() - start_time
+    logging.info('Ingested {0} tweets from {1} in {2:.1f} seconds ({3:.0f} tweets/sec), {4} were already stored '
+                 'and {5} lines were discarded'.format(total_inserted, file_name, elapsed_secs,
+                                                       (total_inserted+total_duplicated)/max(elapsed_secs, 1e-6),
+                                                       total_duplicated, total_discarded))
+    return total_inserted, total_duplicated, total_discarded
@@ -1,54 +1,224 @@
 import pathlib
+import threading
 import tweepy
 import time
 import logging
 
-from src.tweet_collector.add_flags import get_entities_tweet, create_flag, add_values_to_flags
+from src.tweet_collector.add_flags import KeywordCatalog
+from src.tweet_collector.collection_metrics import CollectionMetrics
+from src.tweet_collector.query_planner import PackedQuery
+from src.utils.data_wrangler import TweetEvaluator
 
 
 logging.basicConfig(filename=str(pathlib.Path(__file__).parents[1].joinpath('politic_bots.log')), level=logging.DEBUG)
 
 
+class RateLimitBudget:
+    """
+    Keep track of the requests that an app can still make in the
+    current rate limit window according to the headers of the
+    responses of the Twitter API
+    """
+    def __init__(self):
+        # unknown until the first response is received
+        self.remaining = None
+        self.reset = 0
+        self.__lock = threading.Lock()
+
+    def update(self, headers):
+        remaining = headers.get('x-rate-limit-remaining')
+        reset = headers.get('x-rate-limit-reset')
+        with self.__lock:
+            if remaining is not None:
+                self.remaining = int(remaining)
+            if reset is not None:
+                self.reset = int(reset)
+
+    def seconds_to_reset(self):
+        return max(self.reset - time.time(), 0)
+
+    def has_capacity(self):
+        with self.__lock:
+            if self.remaining is None or self.remaining > 0:
+                return True
+            # the window has been renewed
+            return time.time() >= self.reset
+
+
 class TwitterAPIManager:
-    def __init__(self, credentials, db):
+    def __init__(self, credentials, db, batch_size=0, checkpoints=None, metrics=None, id_filter=None):
+        """
+        :param credentials: dictionary with the key and secret of the app
+        :param db: DBManager of the collection where the tweets are saved
+        :param batch_size: number of tweets to buffer before storing them in
+        bulk, if 0 each tweet is stored as soon as it is downloaded
+        :param checkpoints: KeywordCheckpoints used to search only the tweets
+        that haven't been downloaded yet, if None the whole search window is
+        downloaded
+        :param metrics: CollectionMetrics where the activity of the searches is recorded
+        :param id_filter: TweetIdFilter checked before storing tweets, tweets
+        found in the filter are not sent to the database
+        """
         self.api = None
         self.key = credentials['key']
         self.secret = credentials['secret']
         self.db = db
+        self.batch_size = batch_size
+        self.checkpoints = checkpoints
+        self.metrics = metrics if metrics else CollectionMetrics()
+        self.id_filter = id_filter
+        # metrics of the keyword being searched
+        self.__keyword_metrics = None
+        self.__buffer = []
+        # ids of the buffered tweets, added to the filter once they are stored
+        self.__buffer_ids = set()
+        # checkpoint of the tweets downloaded but not saved yet
+        self.__progress = None
+        self.inserted_tweets, self.duplicated_tweets = 0, 0
+        self.rate_limit = RateLimitBudget()
+        # used to label the relevance of the tweets before storing them
+        self.tweet_evaluator = TweetEvaluator(collection_name=None)
+        if self.batch_size > 0 or self.id_filter is not None:
+            # duplicated tweets are rejected by the index
+            self.db.create_unique_tweet_index()
         self.authenticate()
         
-    def authenticate(self, worl=True, worln=True):
+    def authenticate(self, worl=False, worln=False):
+        # tweepy doesn't wait on the rate limit by default, search_tweets waits
+        # according to the budget of the app and both waits would add up
         auth = tweepy.AppAuthHandler(self.key, self.secret)
         self.api = tweepy.API(
             auth,
             wait_on_rate_limit=worl,
             wait_on_rate_limit_notify=worln)
 
+    def flush(self):
+        # store the buffered tweets
+        if self.__buffer:
+            write_start = time.time()
+            num_inserted, num_duplicated = self.db.add_tweets(self.__buffer)
+            self.__record_write(time.time()-write_start, len(self.__buffer), num_inserted, num_duplicated)
+            self.__add_to_filter(self.__buffer_ids)
+            self.__buffer = []
+            self.__buffer_ids = set()
+        # the checkpoint is saved only after its tweets are stored
+        if self.__progress:
+            self.checkpoints.save_progress(*self.__progress)
+            self.__progress = None
+
+    def __record_write(self, write_secs, batch_size, num_inserted, num_duplicated):
+        self.inserted_tweets += num_inserted
+        self.duplicated_tweets += num_duplicated
+        if self.id_filter is not None:
+            self.id_filter.record_misses(num_duplicated)
+        if self.__keyword_metrics:
+            self.__keyword_metrics.add_write(write_secs, batch_size, num_inserted, num_duplicated)
+
+    def __add_to_filter(self, tweet_ids):
+        # called only after the tweets are stored
+        if self.id_filter is not None:
+            for tweet_id in tweet_ids:
+                self.id_filter.add(tweet_id)
+
     # Add tweets to DB
-    def process_and_store(self, tweet, keyword_type, metadata):
+    def process_and_store(self, tweet, keyword_type, catalog):
+        tweet_id = tweet._json['id_str']
+        if self.id_filter is not None and (tweet_id in self.__buffer_ids or self.id_filter.check(tweet_id)):
+            # the tweet is already stored or waiting in the buffer
+            self.duplicated_tweets += 1
+            if self.__keyword_metrics:
+                self.__keyword_metrics.add_filtered()
+            return
         date = time.strftime('%m/%d/%y')
-        flag, headers = create_flag(metadata)
-        entities = get_entities_tweet(tweet._json)
-        flag = add_values_to_flags(flag, entities, metadata)
-        self.db.add_tweet(tweet._json, keyword_type, date, flag)
+        flag = catalog.flag_tweet(tweet._json)
+        relevance = self.tweet_evaluator.get_tweet_relevance(tweet._json)
+        if self.batch_size > 0:
+            self.__buffer.append(self.db.create_tweet_record(tweet._json, keyword_type, date, flag, relevance))
+            self.__buffer_ids.add(tweet_id)
+            if len(self.__buffer) >= self.batch_size:
+                self.flush()
+        elif self.id_filter is not None:
+            # the filter already checked that the tweet is new
+            write_start = time.time()
+            record = self.db.create_tweet_record(tweet._json, keyword_type, date, flag, relevance)
+            num_inserted, num_duplicated = self.db.add_tweets([record])
+            self.__record_write(time.time()-write_start, 1, num_inserted, num_duplicated)
+            self.__add_to_filter([tweet_id])
+        else:
+            write_start = time.time()
+            inserted = self.db.add_tweet(tweet._json, keyword_type, date, flag, relevance)
+            self.__record_write(time.time()-write_start, 1, int(inserted), 1-int(inserted))
 
     def search_tweets(self, tweets_qry, keyword, keyword_type, metadata):
+        """
+        :param tweets_qry: number of tweets requested per page
+        :param keyword: keyword to search or PackedQuery, in the latter case the type
+        of each tweet is given by the keywords of the query that match the tweet
+        :param keyword_type: string, take the value 'user' or 'hashtag'
+        :param metadata: metadata of the keywords or KeywordCatalog
+        :return: number of downloaded tweets
+        """
         count_tweets = 0
         i = 0
+        packed_query = keyword if isinstance(keyword, PackedQuery) else None
+        keyword = str(keyword)
+        # metadata can be given already compiled to avoid
+        # building the catalog for every keyword
+        if isinstance(metadata, KeywordCatalog):
+            catalog = metadata
+        else:
+            catalog = KeywordCatalog(metadata)
+        cursor_params = self.checkpoints.cursor_params(keyword) if self.checkpoints else {}
+        self.__keyword_metrics = self.metrics.start_keyword(keyword)
+        pages = tweepy.Cursor(
+            self.api.search,
+            q=keyword,
+            count=tweets_qry,
+            locale='es',
+            tweet_mode='extended',
+            include_entities=True,
+            **cursor_params
+        ).pages()
         try:
-            for tweet in tweepy.Cursor(
-                self.api.search,
-                q=keyword,
-                count=tweets_qry,
-                locale='es',
-                tweet_mode='extended',
-                include_entities=True
-            ).items():
-                i += 1
-                self.process_and_store(tweet, keyword_type, metadata)
+            while True:
+                # wait here instead of inside tweepy to know
+                # the time blocked by the rate limit
+                if not self.rate_limit.has_capacity():
+                    wait_start = time.time()
+                    time.sleep(self.rate_limit.seconds_to_reset() + 1)
+                    self.__keyword_metrics.add_rate_limit_wait(time.time()-wait_start)
+                request_start = time.time()
+                try:
+                    page = next(pages)
+                except StopIteration:
+                    break
+                self.__keyword_metrics.add_request(time.time()-request_start, len(page))
+                self.metrics.log_progress()
+                # keep track of the remaining requests of the app
+                last_response = getattr(self.api, 'last_response', None)
+                if last_response is not None:
+                    self.rate_limit.update(last_response.headers)
+                for tweet in page:
+                    i += 1
+                    if packed_query:
+                        keyword_type = packed_query.keyword_type_of(tweet._json)
+                    self.process_and_store(tweet, keyword_type, catalog)
+                if self.checkpoints and page:
+                    page_ids = [tweet.id for tweet in page]
+                    self.__progress = (keyword, min(page_ids), max(page_ids))
+                    if self.batch_size == 0:
+                        self.flush()
             count_tweets += i
+            if self.checkpoints:
+                self.flush()
+                self.checkpoints.complete(keyword)
         except tweepy.TweepError as e:
             # Exit if any error
             logging.error('Error: ' + str(e))
+        finally:
+            self.flush()
+            self.__keyword_metrics.finish()
+            self.__keyword_metrics = None
         logging.info('Downloaded {0} tweets'.format(count_tweets))
+        return count_tweets
 
@@ -4,8 +4,9 @@ from collections import defaultdict
 from datetime import datetime
 from src.utils.db_manager import DBManager
 from src.utils.utils import get_user_handlers_and_hashtags, parse_metadata, get_config, get_py_date, \
-                            clean_emojis, get_video_config_with_user_bearer, calculate_remaining_execution_time
-from src.tweet_collector.add_flags import add_values_to_flags, get_entities_tweet, create_flag
+                            clean_emojis, get_video_config_with_user_bearer, calculate_remaining_execution_time, \
+                            get_tweet_text, get_tweet_type, get_native_dates
+from src.tweet_collector.add_flags import FLAG_ARRAYS, KeywordCatalog, get_flag_arrays
 from math import ceil
 from selenium import webdriver
 
@@ -31,7 +32,10 @@ class TweetEvaluator:
 
     def __init__(self, collection_name='tweets', db_name=''):
         self.user_handlers, self.hashtags = get_user_handlers_and_hashtags()
-        self.__dbm = DBManager(collection=collection_name, db_name=db_name)
+        # without collection the evaluator can only assess
+        # tweets that are given to it (e.g., is_tweet_relevant)
+        if collection_name:
+            self.__dbm = DBManager(collection=collection_name, db_name=db_name)
 
     def __is_relevant(self, users_counter, hashtags_counter):
         # a tweet is considered relevant if fulfills one of two
@@ -86,7 +90,14 @@ class TweetEvaluator:
                 else:
                     return self.__assess_tweet_by_text(tweet['text'])
 
-    def __mark_relevance_rt(self, tweet_reg):
+    def get_tweet_relevance(self, tweet):
+        # retweets take the relevance of the original
+        # tweet as in identify_relevant_tweets
+        if 'retweeted_status' in tweet.keys():
+            tweet = tweet['retweeted_status']
+        return 1 if self.is_tweet_relevant(tweet) else 0
+
+    def __mark_relevance_rt(self, tweet_reg, updater):
         logging.info('Marking RTS...')
         query = {
             'tweet_obj.retweeted_status': {'$exists': 1},
@@ -98,8 +109,7 @@ class TweetEvaluator:
                 'relevante': tweet_reg['relevante']
             }
         }
-        update_res = self.__dbm.update_record_many(query,update)
-        logging.info('Marked {0} RTS...'.format(update_res.matched_count))
+        updater.update_many(query, update)
 
     def identify_relevant_tweets(self):
         # select only original tweets that are not marked as relevant
@@ -125,18 +135,20 @@ class TweetEvaluator:
             logging.info('Identifying relevant tweets in batch {0}/{1} out of {2} tweets...'.format(batch, total_batches, total_tweets_batch))
             tweet_counter = 0
             try:
-                for tweet_reg in tweets:
-                    tweet_counter += 1
-                    tweet = tweet_reg['tweet_obj']
-                    if self.is_tweet_relevant(tweet):
-                        tweet_reg['relevante'] = 1
-                        logging.info('Identifying {0}/{1} tweets (relevant)'.format(tweet_counter, total_tweets))
-                    else:
-                        tweet_reg['relevante'] = 0
-                        logging.info('Identifying {0}/{1} tweets (irrelevant)'.format(tweet_counter, total_tweets))
-                    self.__dbm.update_record({'tweet_obj.id_str': tweet['id_str']},tweet_reg)
-                    # copy the relevance flag to rts
-                    self.__mark_relevance_rt(tweet_reg)
+                # the updates of the batch are written before querying the next batch
+                with self.__dbm.buffered_updater(max_size=self.BATCH_SIZE) as updater:
+                    for tweet_reg in tweets:
+                        tweet_counter += 1
+                        tweet = tweet_reg['tweet_obj']
+                        if self.is_tweet_relevant(tweet):
+                            tweet_reg['relevante'] = 1
+                            logging.info('Identifying {0}/{1} tweets (relevant)'.format(tweet_counter, total_tweets))
+                        else:
+                            tweet_reg['relevante'] = 0
+                            logging.info('Identifying {0}/{1} tweets (irrelevant)'.format(tweet_counter, total_tweets))
+                        updater.update_one({'tweet_obj.id_str': tweet['id_str']}, tweet_reg)
+                        # copy the relevance flag to rts
+                        self.__mark_relevance_rt(tweet_reg, updater)
 
                 logging.info('Finished identifying relevant tweets in batch {0}/{1} out of {2} tweets...'.format(batch, total_batches, total_tweets_batch))
                 batch+=1
@@ -361,17 +373,20 @@ def compute_tweets_local_date(force_computation=False, include_hour=False):
             'tweet_py_datetime': {'$exists': 0}
         }
     s_objs = dbm.search(query, only_relevant_tws=False)
-    for s_obj in s_objs:
-        tweet = s_obj['tweet_obj']
-        py_pub_dt = get_py_date(tweet)
-        dict_to_update = {
-            'tweet_py_datetime': datetime.strftime(py_pub_dt, '%m/%d/%y %H:%M:%S'),
-            'tweet_py_date': datetime.strftime(py_pub_dt, '%m/%d/%y')
-        }
-        if include_hour:
-            dict_to_update.update({'tweet_py_hour': datetime.strftime(py_pub_dt, '%H')})
-        dbm.update_record({'tweet_obj.id_str': tweet['id_str']},
-                          dict_to_update)
+    with dbm.buffered_updater() as updater:
+        for s_obj in s_objs:
+            tweet = s_obj['tweet_obj']
+            py_pub_dt = get_py_date(tweet)
+            dict_to_update = {
+                'tweet_py_datetime': datetime.strftime(py_pub_dt, '%m/%d/%y %H:%M:%S'),
+                'tweet_py_date': datetime.strftime(py_pub_dt, '%m/%d/%y'),
+                'tweet_py_datetime_native': py_pub_dt.replace(tzinfo=None)
+            }
+            if include_hour:
+                dict_to_update.update({'tweet_py_hour': datetime.strftime(py_pub_dt, '%H')})
+            updater.update_one({'tweet_obj.id_str': tweet['id_str']},
+                               dict_to_update)
+    logging.info('Computed the local date of {0} tweets'.format(updater.modified))
     return
 
 
@@ -510,13 +525,13 @@ def fix_tweets_with_empty_flags():
     conf_file = script_parent_dir.joinpath('config.json')
     configuration = get_config(conf_file)
     keyword, k_metadata = parse_metadata(configuration['metadata'])
+    catalog = KeywordCatalog(k_metadata)
     tweets_with_empty_flags = dbm.search({'flag.keyword': {'$size': 0}, 'relevante': 1})
-    for tweet in tweets_with_empty_flags:
-        logging.info('Updating flags of tweet {0}'.format(tweet['tweet_obj']['id_str']))
-        flag, headers = create_flag(k_metadata)
-        entities = get_entities_tweet(tweet['tweet_obj'])
-        flag = add_values_to_flags(flag, entities, k_metadata)
-        dbm.update_record({'tweet_obj.id_str': tweet['tweet_obj']['id_str']}, flag)
+    with dbm.buffered_updater() as updater:
+        for tweet in tweets_with_empty_flags:
+            logging.info('Updating flags of tweet {0}'.format(tweet['tweet_obj']['id_str']))
+            flag = catalog.flag_tweet(tweet['tweet_obj'])
+            updater.update_one({'tweet_obj.id_str': tweet['tweet_obj']['id_str']}, flag)
 
 
 def add_fields(dbm, update_queries):
@@ -526,20 +541,6 @@ def add_fields(dbm, update_queries):
     logging.info('Added fields to {0:,} tweets'.format(modified_tweets))
 
 
-def get_tweet_text(tweet):
-    try:
-        if 'extended_tweet' in tweet:
-            tweet_txt = tweet['extended_tweet']['full_text']
-        elif 'full_text' in tweet:
-            tweet_txt = tweet['full_text']
-        else:
-            tweet_txt = tweet['text']
-        return tweet_txt
-    except Exception as e:
-        logging.error('Exception {}'.format(e))
-        logging.info(tweet)
-
-
 def add_complete_text_attr(collection='tweets'):
     dbm = DBManager(collection=collection)
     query = {
@@ -576,16 +577,83 @@ def add_complete_text_attr(collection='tweets'):
         add_fields(dbm, update_queries)
 
 
-def get_tweet_type(tweet):
-    if 'retweeted_status' in tweet:
-        tweet_type = 'retweet'
-    elif 'is_quote_status' in tweet and tweet['is_quote_status']:
-        tweet_type = 'quote'
-    elif 'in_reply_to_status_id_str' in tweet and tweet['in_reply_to_status_id_str']:
-        tweet_type = 'reply'
-    else:
-        tweet_type = 'original'
-    return tweet_type
+def add_flag_arrays_attr(collection='tweets'):
+    dbm = DBManager(collection=collection)
+    query = {
+        'flag_parties': {'$exists': 0}
+    }
+    projection = {
+        '_id': 1
+    }
+    for flag_name in FLAG_ARRAYS.keys():
+        projection['flag.' + flag_name] = 1
+    logging.info('Finding tweets...')
+    docs = dbm.find_all(query, projection)
+    total_tweets = docs.count()
+    logging.info('Found {:,} tweets'.format(total_tweets))
+    max_batch = BATCH_SIZE if total_tweets > BATCH_SIZE else total_tweets
+    update_queries = []
+    processing_counter = total_segs = 0
+    for doc in docs:
+        start_time = time.time()
+        processing_counter += 1
+        update_queries.append({
+            'filter': {'_id': doc['_id']},
+            'new_values': get_flag_arrays(doc.get('flag', {}))
+        })
+        if len(update_queries) == max_batch:
+            add_fields(dbm, update_queries)
+            update_queries = []
+        total_segs = calculate_remaining_execution_time(start_time, total_segs,
+                                                        processing_counter,
+                                                        total_tweets)
+    if len(update_queries) > 0:
+        add_fields(dbm, update_queries)
+
+
+def add_native_dates_attr(collection='tweets'):
+    dbm = DBManager(collection=collection)
+    query = {
+        'extraction_dt': {'$exists': 0}
+    }
+    projection = {
+        '_id': 1,
+        'extraction_date': 1,
+        'tweet_obj.created_at': 1
+    }
+    logging.info('Finding tweets...')
+    docs = dbm.find_all(query, projection)
+    total_tweets = docs.count()
+    logging.info('Found {:,} tweets'.format(total_tweets))
+    max_batch = BATCH_SIZE if total_tweets > BATCH_SIZE else total_tweets
+    update_queries = []
+    processing_counter = total_segs = num_skipped = 0
+    try:
+        for doc in docs:
+            start_time = time.time()
+            processing_counter += 1
+            try:
+                native_dates = get_native_dates(get_py_date(doc['tweet_obj']), doc.get('extraction_date'))
+            except (KeyError, TypeError, ValueError) as e:
+                # tweets without dates or with malformed ones are left as they are
+                num_skipped += 1
+                logging.error('Could not get the native dates of the tweet {0}. Error: {1}'.format(doc['_id'], e))
+                continue
+            update_queries.append({
+                'filter': {'_id': doc['_id']},
+                'new_values': native_dates
+            })
+            if len(update_queries) == max_batch:
+                add_fields(dbm, update_queries)
+                update_queries = []
+            total_segs = calculate_remaining_execution_time(start_time, total_segs,
+                                                            processing_counter,
+                                                            total_tweets)
+    finally:
+        if len(update_queries) > 0:
+            add_fields(dbm, update_queries)
+    if num_skipped:
+        logging.warning('{0} tweets were skipped because of their dates'.format(num_skipped))
 
 
 def add_tweet_type_attr(collection='tweets'):
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+
+from src.utils.utils import get_column_values
+
+
+# DataFrames built from documents flattened to a fixed schema, kept apart from
+# utils so that only the modules that build DataFrames need pandas
+
+
+def get_column_array(values, column_type):
+    # integers and booleans with missing values can't be stored in numpy arrays
+    # of their type, integers use the nullable type of pandas, booleans objects
+    if column_type == 'int64':
+        return pd.array(values, dtype='Int64')
+    if column_type == 'float64':
+        return np.array(values, dtype='float64')
+    if column_type == 'bool' and None not in values:
+        return np.array(values, dtype='bool')
+    if column_type in ['date', 'datetime']:
+        return pd.to_datetime(values)
+    array = np.empty(len(values), dtype='object')
+    array[:] = values
+    return array
+
+
+def get_dataframe(docs, columns, chunk_size=10000):
+    """
+    Build a DataFrame from documents flattened to a fixed schema. Documents
+    are converted to typed column arrays in chunks, which are concatenated
+    once at the end, so only the documents of a chunk are kept in memory
+
+    :param docs: iterable of documents, e.g., a cursor
+    :param columns: list of tuples (name, path, type), see get_column_values
+    :param chunk_size: number of documents of each chunk
+    :return: DataFrame with a column for each of the given ones
+    """
+    docs = iter(docs)
+    names = [name for name, _, _ in columns]
+    frames = []
+    while True:
+        chunk = [doc for _, doc in zip(range(chunk_size), docs)]
+        if not chunk and frames:
+            break
+        values = get_column_values(chunk, columns)
+        frames.append(pd.DataFrame({name: get_column_array(values[name], column_type)
+                                    for name, _, column_type in columns}, columns=names))
+        if len(chunk) < chunk_size:
+            break
+    df = frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True, copy=False)
+    # the type of boolean columns doesn't depend on the chunks that have missing values
+    for name, _, column_type in columns:
+        if column_type == 'bool' and len(df) and not df[name].isnull().any():
+            df[name] = df[name].astype('bool')
+    return df
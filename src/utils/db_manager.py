@@ -1,34 +1,159 @@
 from collections import defaultdict
 from datetime import datetime
-from pymongo import MongoClient, UpdateOne
-from src.utils.utils import get_config, get_user_handlers_and_hashtags, get_py_date
+from pymongo import ASCENDING, MongoClient, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure
+from src.utils.query_profiler import ProfiledDatabase, get_query_profiler, summarize_explanation
+from src.utils.sqlite_backend import SQLiteUpdateMany, SQLiteUpdateOne, get_sqlite_database
+from src.utils.utils import TWEET_COLUMNS, get_cached_config, get_user_handlers_and_hashtags, get_native_dates, \
+    get_py_date, get_tweet_text, get_tweet_type
 
+import os
 import pathlib
 import logging
+import threading
+import time
 
 
 logging.basicConfig(filename=str(pathlib.Path(__file__).parents[1].joinpath('politic_bots.log')), level=logging.DEBUG)
 
 
+# Indexes of the collections, each index is given by its keys and the options
+# passed to create_index. Partial indexes on relevante only hold relevant tweets,
+# which are the ones queried by the getters
+RELEVANT_TWEETS = {'partialFilterExpression': {'relevante': 1}}
+INDEXES = {
+    'tweets': [
+        {'keys': [('tweet_obj.id_str', ASCENDING)], 'options': {'unique': True}},
+        {'keys': [('tweet_obj.user.screen_name', ASCENDING)]},
+        {'keys': [('tweet_obj.retweeted_status.id_str', ASCENDING)], 'options': {'sparse': True}},
+        {'keys': [('relevante', ASCENDING)]},
+        {'keys': [('tweet_py_date', ASCENDING)], 'options': RELEVANT_TWEETS},
+        {'keys': [('extraction_date', ASCENDING)], 'options': RELEVANT_TWEETS},
+        {'keys': [('extraction_dt', ASCENDING)], 'options': RELEVANT_TWEETS},
+        {'keys': [('tweet_py_datetime_native', ASCENDING)], 'options': RELEVANT_TWEETS},
+        {'keys': [('flag_parties', ASCENDING)], 'options': RELEVANT_TWEETS},
+        {'keys': [('flag_movements', ASCENDING)], 'options': RELEVANT_TWEETS},
+        {'keys': [('flag_candidates', ASCENDING)], 'options': RELEVANT_TWEETS}
+    ],
+    'users': [
+        {'keys': [('screen_name', ASCENDING)]},
+        # users analyzed or not by the bot detector ({'bot_analysis': {'$exists': 0/1}})
+        {'keys': [('bot_analysis', ASCENDING)]},
+        {'keys': [('party', ASCENDING), ('movement', ASCENDING)]}
+    ],
+    'networks': [
+        {'keys': [('depth', ASCENDING)]}
+    ],
+    'checkpoints': [
+        {'keys': [('keyword', ASCENDING)], 'options': {'unique': True}}
+    ]
+}
+
+
+class BufferedUpdater:
+    """
+    Buffer of update operations that are sent to the collection in unordered
+    bulk writes, either when the buffer reaches max_size operations or when
+    max_secs seconds passed since the last write. The time is checked when
+    operations are added, so flush (or the end of a with block) writes the
+    operations that remain in the buffer
+
+    :param collection: collection where the updates are written
+    :param max_size: maximum number of operations in the buffer
+    :param max_secs: maximum number of seconds between writes
+    :param update_types: classes of the update operations of the storage backend
+    (update one, update many)
+    """
+    def __init__(self, collection, max_size=1000, max_secs=60, update_types=(UpdateOne, UpdateMany)):
+        self.__collection = collection
+        self.__update_one, self.__update_many = update_types
+        self.max_size = max_size
+        self.max_secs = max_secs
+        self.__operations = []
+        self.__last_write = time.time()
+        self.matched, self.modified, self.upserted = 0, 0, 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
+    def update_one(self, filter_query, new_values, create_if_doesnt_exist=False):
+        # same as DBManager.update_record
+        self.add(self.__update_one(filter_query, {'$set': new_values}, upsert=create_if_doesnt_exist))
+
+    def update_many(self, filter_query, update_query, create_if_doesnt_exist=False):
+        # same as DBManager.update_record_many
+        self.add(self.__update_many(filter_query, update_query, upsert=create_if_doesnt_exist))
+
+    def add(self, operation):
+        self.__operations.append(operation)
+        if len(self.__operations) >= self.max_size or time.time() - self.__last_write >= self.max_secs:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the operations in the buffer
+        :return: number of documents modified since the updater was created
+        """
+        if self.__operations:
+            ret = self.__collection.bulk_write(self.__operations, ordered=False)
+            self.matched += ret.matched_count
+            self.modified += ret.modified_count
+            self.upserted += ret.upserted_count
+            logging.info('Wrote {0} updates, {1} documents modified and {2} upserted'.format(
+                len(self.__operations), ret.modified_count, ret.upserted_count))
+            self.__operations = []
+        self.__last_write = time.time()
+        return self.modified
+
+
 class DBManager:
     __db = None
     __host = None
     __collection = ''
+    # classes of the update operations of bulk_write
+    __update_types = (UpdateOne, UpdateMany)
+    # clients shared by all the instances, indexed by process, host and port
+    __clients = {}
+    __clients_lock = threading.Lock()
 
     def __init__(self, collection, db_name = ""):
         script_parent_dir = pathlib.Path(__file__).parents[1]
         config_fn = script_parent_dir.joinpath('config.json')
-        config = get_config(config_fn)
-        self.__host = config['mongo']['host']
-        self.__port = config['mongo']['port']
-        client = MongoClient(self.__host+':'+self.__port)
-
-        if not db_name:
-            self.__db = client[config['mongo']['db_name']]
+        config = get_cached_config(config_fn)
+        storage = config.get('storage', {})
+        if storage.get('backend', 'mongodb') == 'sqlite':
+            # embedded snapshot of the database, see create_sqlite_snapshot in run.py
+            self.__db = get_sqlite_database(script_parent_dir.joinpath(storage['sqlite_file']))
+            self.__update_types = (SQLiteUpdateOne, SQLiteUpdateMany)
+            if db_name and db_name != config['mongo']['db_name']:
+                logging.warning('The database {0} is not used, the SQLite backend only holds the database {1}'.
+                                format(db_name, config['mongo']['db_name']))
         else:
-            self.__db = client[db_name]
+            self.__host = config['mongo']['host']
+            self.__port = config['mongo']['port']
+            client = self.__get_client(self.__host, self.__port, config['mongo'].get('pool_size', 100))
+            if not db_name:
+                self.__db = client[config['mongo']['db_name']]
+            else:
+                self.__db = client[db_name]
+        profiler = get_query_profiler(config, script_parent_dir)
+        if profiler:
+            self.__db = ProfiledDatabase(self.__db, profiler)
         self.__collection = collection
 
+    @classmethod
+    def __get_client(cls, host, port, pool_size):
+        # clients are not shared with forked processes
+        key = (os.getpid(), host, port)
+        with cls.__clients_lock:
+            if key not in cls.__clients:
+                logging.info('Connecting to the MongoDB server {0}:{1}'.format(host, port))
+                cls.__clients[key] = MongoClient(host+':'+port, maxPoolSize=pool_size)
+            return cls.__clients[key]
+
     def num_records_collection(self):
         return self.__db[self.__collection].find({}).count()
 
@@ -67,8 +192,7 @@ class DBManager:
 
     def find_tweets_by_author(self, author_screen_name, **kwargs):
         query = {'tweet_obj.user.screen_name': author_screen_name, 'relevante': 1}
-        if 'limited_to_time_window' in kwargs.keys():
-            query.update({'extraction_date': {'$in': kwargs['limited_to_time_window']}})
+        self.__add_time_filters(query, **kwargs)
         return self.search(query)
 
     def find_all(self, query={}, projection=None, sort=None, pagination=None):
@@ -100,22 +224,96 @@ class DBManager:
         else:
             return self.__db[self.__collection].find(query)
 
+    def iter_pages(self, query={}, key='_id', page_size=1000, projection=None):
+        """
+        Iterate over the documents that match a query in pages sorted by key.
+        Each page is searched from the last key of the previous one, so unlike
+        the pagination of find_all its cost does not depend on its position, and
+        updating the documents already returned does not shift the next pages
+        :param query: dictionary, filter of the query
+        :param key: field with unique values used to sort and resume the pages
+        :param page_size: number of documents of each page
+        :param projection: dictionary, fields to return, the key is always returned
+        :return: generator of lists of documents
+        """
+        if projection:
+            projection = dict(projection, **{key: 1})
+        last_key = None
+        while True:
+            page_query = query if last_key is None else {'$and': [query, {key: {'$gt': last_key}}]}
+            page = list(self.__db[self.__collection].find(page_query, projection).
+                        sort(key, ASCENDING).limit(page_size))
+            if not page:
+                return
+            yield page
+            if len(page) < page_size:
+                return
+            last_key = page[-1]
+            for field in key.split('.'):
+                last_key = last_key[field]
+
     def find_tweets_by_hashtag(self, hashtag, **kwargs):
         query = {'type': 'hashtag', 'keyword': hashtag, 'relevante': 1}
-        if 'limited_to_time_window' in kwargs.keys():
-            query.update({'extraction_date': {'$in': kwargs['limited_to_time_window']}})
+        self.__add_time_filters(query, **kwargs)
         return self.search(query)
 
     def aggregate(self, pipeline):
         return [doc for doc in self.__db[self.__collection].aggregate(pipeline, allowDiskUse=True)]
 
+    def aggregate_iter(self, pipeline, batch_size=1000):
+        """
+        Run an aggregation and get its results lazily, the documents are
+        fetched from the server in batches while the cursor is consumed
+        :param pipeline: list with the stages of the aggregation
+        :param batch_size: number of documents fetched per batch
+        :return: cursor over the resulting documents
+        """
+        return self.__db[self.__collection].aggregate(pipeline, allowDiskUse=True, batchSize=batch_size)
+
+    def __count(self, pipeline):
+        # the server returns a single document with the number of matching documents
+        pipeline.append({'$count': 'count'})
+        result = self.aggregate(pipeline)
+        return result[0]['count'] if result else 0
+
+    def __aggregate(self, pipeline, stream, fields=None):
+        # fields limits the documents to the given fields, e.g., ['tweet_obj.id_str', 'tweet_py_date']
+        if fields:
+            pipeline.append({'$project': {field: 1 for field in fields}})
+        if stream:
+            return self.aggregate_iter(pipeline)
+        return self.aggregate(pipeline)
+
+    @staticmethod
+    def __add_time_filters(match, **kwargs):
+        # limited_to_time_window takes either a list of extraction dates (mm/dd/yy) or a tuple
+        # (start, end) of datetimes, published_time_window takes a tuple (start, end) of datetimes
+        # in the local time of the tweets. Ranges include start and exclude end
+        if 'limited_to_time_window' in kwargs.keys():
+            time_window = kwargs['limited_to_time_window']
+            if isinstance(time_window, tuple):
+                match.update({'extraction_dt': {'$gte': time_window[0], '$lt': time_window[1]}})
+            else:
+                match.update({'extraction_date': {'$in': time_window}})
+        if 'published_time_window' in kwargs.keys():
+            time_window = kwargs['published_time_window']
+            match.update({'tweet_py_datetime_native': {'$gte': time_window[0], '$lt': time_window[1]}})
+        return match
+
+    @staticmethod
+    def __add_flag_condition(match, array_name, operator, value):
+        # conditions on the same array are merged, e.g., {'$all': ['anr'], '$nin': ['honor colorado']}
+        condition = match.get(array_name, {})
+        condition[operator] = condition.get(operator, []) + [value]
+        match[array_name] = condition
+
     def __add_extra_filters(self, match, **kwargs):
         if 'partido' in kwargs.keys():
-            match.update({'flag.partido_politico.' + kwargs['partido']: {'$gt': 0}})
+            self.__add_flag_condition(match, 'flag_parties', '$all', kwargs['partido'])
         if 'movimiento' in kwargs.keys():
-            match.update({'flag.movimiento.' + kwargs['movimiento']: {'$gt': 0}})
+            self.__add_flag_condition(match, 'flag_movements', '$all', kwargs['movimiento'])
         if 'no_movimiento' in kwargs.keys():
-            match.update({'flag.movimiento.' + kwargs['no_movimiento']: {'$eq': 0}})
+            self.__add_flag_condition(match, 'flag_movements', '$nin', kwargs['no_movimiento'])
         if 'puesto' in kwargs.keys():
             match.update({'flag.puesto.' + kwargs['puesto']: {'$gt': 0}})
         if 'include_candidate' in kwargs.keys() and not kwargs['include_candidate']:
@@ -123,11 +321,10 @@ class DBManager:
                 match.update({'tweet_obj.user.screen_name': {'$ne': kwargs['candidate_handler']}})
             else:
                 logging.error('The parameter candidate_handler cannot be empty')
-        if 'limited_to_time_window' in kwargs.keys():
-            match.update({'extraction_date': {'$in': kwargs['limited_to_time_window']}})
+        self.__add_time_filters(match, **kwargs)
         return match
 
-    def get_original_tweets(self, **kwargs):
+    def __original_tweets_pipeline(self, **kwargs):
         match = {
             'relevante': {'$eq': 1},
             'tweet_obj.retweeted_status': {'$exists': 0},
@@ -135,10 +332,15 @@ class DBManager:
             'tweet_obj.is_quote_status': False
         }
         match = self.__add_extra_filters(match, **kwargs)
-        pipeline = [{'$match': match}]
-        return self.aggregate(pipeline)
+        return [{'$match': match}]
+
+    def get_original_tweets(self, stream=False, fields=None, **kwargs):
+        return self.__aggregate(self.__original_tweets_pipeline(**kwargs), stream, fields)
 
-    def get_retweets(self, **kwargs):
+    def count_original_tweets(self, **kwargs):
+        return self.__count(self.__original_tweets_pipeline(**kwargs))
+
+    def __retweets_pipeline(self, **kwargs):
         match = {
             'relevante': {'$eq': 1},
             'tweet_obj.retweeted_status': {'$exists': 1},
@@ -146,10 +348,15 @@ class DBManager:
             'tweet_obj.is_quote_status': False
         }
         match = self.__add_extra_filters(match, **kwargs)
-        pipeline = [{'$match': match}]
-        return self.aggregate(pipeline)
+        return [{'$match': match}]
+
+    def get_retweets(self, stream=False, fields=None, **kwargs):
+        return self.__aggregate(self.__retweets_pipeline(**kwargs), stream, fields)
 
-    def get_replies(self, **kwargs):
+    def count_retweets(self, **kwargs):
+        return self.__count(self.__retweets_pipeline(**kwargs))
+
+    def __replies_pipeline(self, **kwargs):
         match = {
             'relevante': {'$eq': 1},
             'tweet_obj.retweeted_status': {'$exists': 0},
@@ -157,17 +364,27 @@ class DBManager:
             'tweet_obj.is_quote_status': False
         }
         match = self.__add_extra_filters(match, **kwargs)
-        pipeline = [{'$match': match}]
-        return self.aggregate(pipeline)
+        return [{'$match': match}]
 
-    def get_quotes(self, **kwargs):
+    def get_replies(self, stream=False, fields=None, **kwargs):
+        return self.__aggregate(self.__replies_pipeline(**kwargs), stream, fields)
+
+    def count_replies(self, **kwargs):
+        return self.__count(self.__replies_pipeline(**kwargs))
+
+    def __quotes_pipeline(self, **kwargs):
         match = {
             'relevante': {'$eq': 1},
             'tweet_obj.is_quote_status': True
         }
         match = self.__add_extra_filters(match, **kwargs)
-        pipeline = [{'$match': match}]
-        return self.aggregate(pipeline)
+        return [{'$match': match}]
+
+    def get_quotes(self, stream=False, fields=None, **kwargs):
+        return self.__aggregate(self.__quotes_pipeline(**kwargs), stream, fields)
+
+    def count_quotes(self, **kwargs):
+        return self.__count(self.__quotes_pipeline(**kwargs))
 
     def get_sentiment_tweets(self, type_query='all', **kwargs):
         if type_query == 'original':
@@ -219,12 +436,10 @@ class DBManager:
                 '$sort': {'count': -1}
             }
         ]
-        result_docs = self.aggregate(pipeline)
-        if 'partido' in kwargs.keys() or 'movimiento' in kwargs.keys():
-            return self.update_counts(result_docs, **kwargs)
-        return result_docs
+        pipeline.extend(self.__domain_info_stages(**kwargs))
+        return self.aggregate(pipeline)
 
-    def get_plain_tweets(self, **kwargs):
+    def __plain_tweets_pipeline(self, **kwargs):
         match = {
             'relevante': {'$eq': 1},
             'tweet_obj.entities.media': {'$exists': 0},  # don't have media
@@ -240,10 +455,15 @@ class DBManager:
                               {'$and': [{'tweet_obj.retweeted_status': {'$exists': 1}},
                                         {'tweet_obj.is_quote_status': True}]}]}
         filter_videos = {'$or': [{'is_video': {'$exists': 0}}, {'is_video': 0}]}
-        pipeline = [{'$match': match}, {'$match': filter_rts}, {'$match': filter_videos}]
-        return self.aggregate(pipeline)
+        return [{'$match': match}, {'$match': filter_rts}, {'$match': filter_videos}]
+
+    def get_plain_tweets(self, stream=False, fields=None, **kwargs):
+        return self.__aggregate(self.__plain_tweets_pipeline(**kwargs), stream, fields)
 
-    def get_tweets_with_links(self, **kwargs):
+    def count_plain_tweets(self, **kwargs):
+        return self.__count(self.__plain_tweets_pipeline(**kwargs))
+
+    def __tweets_with_links_pipeline(self, **kwargs):
         match = {
             'relevante': {'$eq': 1},
             'tweet_obj.entities.media': {'$exists': 0},  # don't have media
@@ -260,8 +480,13 @@ class DBManager:
         filter_rts = {'$or': [{'tweet_obj.retweeted_status': {'$exists': 0}},
                               {'$and': [{'tweet_obj.retweeted_status': {'$exists': 1}},
                                         {'tweet_obj.is_quote_status': True}]}]}
-        pipeline = [{'$match': match}, {'$match': filter_rts}]
-        return self.aggregate(pipeline)
+        return [{'$match': match}, {'$match': filter_rts}]
+
+    def get_tweets_with_links(self, stream=False, fields=None, **kwargs):
+        return self.__aggregate(self.__tweets_with_links_pipeline(**kwargs), stream, fields)
+
+    def count_tweets_with_links(self, **kwargs):
+        return self.__count(self.__tweets_with_links_pipeline(**kwargs))
 
     def get_domains_of_tweets_with_links(self, **kwargs):
         match = {
@@ -295,7 +520,7 @@ class DBManager:
         ]
         return self.aggregate(pipeline)
 
-    def get_tweets_with_photo(self, **kwargs):
+    def __tweets_with_photo_pipeline(self, **kwargs):
         match = {
             'relevante': {'$eq': 1},
             'tweet_obj.entities.media': {'$ne': []},           # choose tweets with media
@@ -305,10 +530,15 @@ class DBManager:
         filter_rts = {'$or': [{'tweet_obj.retweeted_status': {'$exists': 0}},
                               {'$and': [{'tweet_obj.retweeted_status': {'$exists': 1}},
                                         {'tweet_obj.is_quote_status': True}]}]}
-        pipeline = [{'$match': match}, {'$match': filter_rts}]
-        return self.aggregate(pipeline)
+        return [{'$match': match}, {'$match': filter_rts}]
+
+    def get_tweets_with_photo(self, stream=False, fields=None, **kwargs):
+        return self.__aggregate(self.__tweets_with_photo_pipeline(**kwargs), stream, fields)
+
+    def count_tweets_with_photo(self, **kwargs):
+        return self.__count(self.__tweets_with_photo_pipeline(**kwargs))
 
-    def get_tweets_with_video(self, **kwargs):
+    def __tweets_with_video_pipeline(self, **kwargs):
         match = {
             'relevante': {'$eq': 1},
             'is_video': {'$eq': 1}
@@ -317,33 +547,53 @@ class DBManager:
         filter_rts = {'$or': [{'tweet_obj.retweeted_status': {'$exists': 0}},
                               {'$and': [{'tweet_obj.retweeted_status': {'$exists': 1}},
                                         {'tweet_obj.is_quote_status': True}]}]}
-        pipeline = [{'$match': match}, {'$match': filter_rts}]
-        return self.aggregate(pipeline)
+        return [{'$match': match}, {'$match': filter_rts}]
+
+    def get_tweets_with_video(self, stream=False, fields=None, **kwargs):
+        return self.__aggregate(self.__tweets_with_video_pipeline(**kwargs), stream, fields)
+
+    def count_tweets_with_video(self, **kwargs):
+        return self.__count(self.__tweets_with_video_pipeline(**kwargs))
+
+    def __add_dominant_domain_filters(self, match, **kwargs):
+        # keep only the tweets that mention the given party/movement at least as
+        # much as any other, so ties are resolved in favor of the given one
+        conditions = []
+        for kwarg, flag_name, array_name in [('partido', 'partido_politico', 'flag_parties'),
+                                             ('movimiento', 'movimiento', 'flag_movements')]:
+            if kwarg in kwargs.keys():
+                self.__add_flag_condition(match, array_name, '$all', kwargs[kwarg])
+                flag_counts = {'$map': {'input': {'$objectToArray': '$flag.' + flag_name},
+                                        'as': 'flag', 'in': '$$flag.v'}}
+                conditions.append({'$gte': ['$flag.{0}.{1}'.format(flag_name, kwargs[kwarg]),
+                                            {'$max': flag_counts}]})
+        if conditions:
+            match.update({'$expr': {'$and': conditions}})
+        return match
+
+    @staticmethod
+    def __domain_info_stages(**kwargs):
+        # the results of queries on a party or movement carry the filters used
+        if 'partido' in kwargs.keys() or 'movimiento' in kwargs.keys():
+            return [{'$addFields': {key: {'$literal': value} for key, value in kwargs.items()}}]
+        return []
 
     def __update_dicts_with_domain_info(self, match, group, project, **kwargs):
-        if 'partido' in kwargs.keys():
-            match.update({'flag.partido_politico.' + kwargs['partido']: {'$gt': 0}})
-            group.update({'partido_politico': {'$push': '$flag.partido_politico'}})
-            project.update({'partido_politico': '$partido_politico'})
-        if 'movimiento' in kwargs.keys():
-            match.update({'flag.movimiento.' + kwargs['movimiento']: {'$gt': 0}})
-            group.update({'movimiento': {'$push': '$flag.movimiento'}})
-            project.update({'movimiento': '$movimiento'})
+        match = self.__add_dominant_domain_filters(match, **kwargs)
         if 'no_movimiento' in kwargs.keys():
-            match.update({'flag.movimiento.' + kwargs['no_movimiento']: {'$eq': 0}})
+            self.__add_flag_condition(match, 'flag_movements', '$nin', kwargs['no_movimiento'])
         if 'include_candidate' in kwargs.keys() and not kwargs['include_candidate']:
             if 'candidate_handler' in kwargs.keys() and kwargs['candidate_handler'] != '':
                 match.update({'tweet_obj.user.screen_name': {'$ne': kwargs['candidate_handler']}})
             else:
                 logging.error('The parameter candidate_handler cannot be empty')
-        if 'limited_to_time_window' in kwargs.keys():
-            match.update({'extraction_date': {'$in': kwargs['limited_to_time_window']}})
+        self.__add_time_filters(match, **kwargs)
 
         return match, group, project
 
     def get_hashtags_by_movement(self, movement_name, **kwargs):
         match = {
-            'flag.movimiento.'+movement_name: {'$gt': 0},
+            'flag_movements': movement_name,
             'relevante': {'$eq': 1}
         }
         if 'include_candidate' in kwargs.keys() and not kwargs['include_candidate']:
@@ -351,8 +601,7 @@ class DBManager:
                 match.update({'tweet_obj.user.screen_name': {'$ne': kwargs['candidate_handler']}})
             else:
                 logging.error('The parameter candidate_handler cannot be empty')
-        if 'limited_to_time_window' in kwargs.keys():
-            match.update({'extraction_date': {'$in': kwargs['limited_to_time_window']}})
+        self.__add_time_filters(match, **kwargs)
         pipeline = [
             {
                 '$match': match
@@ -389,7 +638,7 @@ class DBManager:
 
     def get_hashtags_by_candidate(self, candidate_name, **kwargs):
         match = {
-            'flag.candidatura.'+candidate_name: {'$gt': 0},
+            'flag_candidates': candidate_name,
             'relevante': {'$eq': 1}
         }
         if 'include_candidate' in kwargs.keys() and not kwargs['include_candidate']:
@@ -397,8 +646,7 @@ class DBManager:
                 match.update({'tweet_obj.user.screen_name': {'$ne': kwargs['candidate_handler']}})
             else:
                 logging.error('The parameter candidate_handler cannot be empty')
-        if 'limited_to_time_window' in kwargs.keys():
-            match.update({'extraction_date': {'$in': kwargs['limited_to_time_window']}})
+        self.__add_time_filters(match, **kwargs)
         pipeline = [
             {
                 '$match': match
@@ -438,22 +686,39 @@ class DBManager:
             'relevante': {'$eq': 1}
         }
         if 'partido' in kwargs.keys():
-            match.update({'flag.partido_politico.'+kwargs['partido']: {'$gt': 0}})
+            self.__add_flag_condition(match, 'flag_parties', '$all', kwargs['partido'])
         if 'movimiento' in kwargs.keys():
-            match.update({'flag.movimiento.'+kwargs['movimiento']: {'$gt': 0}})
+            self.__add_flag_condition(match, 'flag_movements', '$all', kwargs['movimiento'])
         if 'candidatura' in kwargs.keys():
-            match.update({'flag.candidatura.'+kwargs['candidatura']: {'$gt': 0}})
+            self.__add_flag_condition(match, 'flag_candidates', '$all', kwargs['candidatura'])
         if 'include_candidate' in kwargs.keys() and not kwargs['include_candidate']:
             if 'candidate_handler' in kwargs.keys() and kwargs['candidate_handler'] != '':
                 match.update({'tweet_obj.user.screen_name': {'$ne': kwargs['candidate_handler']}})
             else:
                 logging.error('The parameter candidate_handler cannot be empty')
-        if 'limited_to_time_window' in kwargs.keys():
-            match.update({'extraction_date': {'$in': kwargs['limited_to_time_window']}})
+        self.__add_time_filters(match, **kwargs)
+        # type of interaction of each tweet and users with whom the author interacts,
+        # the users mentioned are only considered in tweets that are not retweets,
+        # quotes or replies
+        is_rt = {'$gt': ['$tweet_obj.retweeted_status.id_str', None]}
+        is_qt = {'$gt': ['$tweet_obj.quoted_status_id', None]}
+        is_rp = {'$or': ['$tweet_obj.in_reply_to_status_id_str', '$tweet_obj.in_reply_to_screen_name']}
+        interaction_type = {'$switch': {'branches': [{'case': is_rt, 'then': 'retweets'},
+                                                     {'case': is_qt, 'then': 'quotes'},
+                                                     {'case': is_rp, 'then': 'replies'}],
+                                        'default': 'mentions'}}
+        interacted_users = {'$switch': {'branches': [
+                                            {'case': is_rt, 'then': ['$tweet_obj.retweeted_status.user.screen_name']},
+                                            {'case': is_qt, 'then': ['$tweet_obj.quoted_status.user.screen_name']},
+                                            {'case': is_rp, 'then': ['$tweet_obj.in_reply_to_screen_name']}],
+                                        'default': '$tweet_obj.entities.user_mentions.screen_name'}}
         pipeline = [
             {
                 '$match': match
             },
+            {
+                '$addFields': {'interaction_type': interaction_type}
+            },
             {
                 '$group': {
                     '_id': '$tweet_obj.user.id_str',
@@ -474,16 +739,15 @@ class DBManager:
                     'favourites_count': {'$last': '$tweet_obj.user.favourites_count'},
                     'listed_count': {'$last': '$tweet_obj.user.listed_count'},
                     'tweets_count': {'$sum': 1},
-                    'tweets': {'$push': {'text': '$tweet_obj.text',
-                                         'mentions': '$tweet_obj.entities.user_mentions',
-                                         'quote': '$tweet_obj.quoted_status_id',
-                                         'quoted_user_id': '$tweet_obj.quoted_status.user.screen_name',
-                                         'reply': '$tweet_obj.in_reply_to_status_id_str',
-                                         'replied_user_id': '$tweet_obj.in_reply_to_screen_name',
-                                         'retweet': '$tweet_obj.retweeted_status.id_str',
-                                         'retweeted_user_id': '$tweet_obj.retweeted_status.user.screen_name'
-                                         }
-                                }
+                    'retweets_count': {'$sum': {'$cond': [{'$eq': ['$interaction_type', 'retweets']}, 1, 0]}},
+                    'quotes_count': {'$sum': {'$cond': [{'$eq': ['$interaction_type', 'quotes']}, 1, 0]}},
+                    'replies_count': {'$sum': {'$cond': [{'$eq': ['$interaction_type', 'replies']}, 1, 0]}}
+                }
+            },
+            {
+                '$addFields': {
+                    'original_count': {'$subtract': ['$tweets_count', {'$add': ['$retweets_count', '$quotes_count',
+                                                                                '$replies_count']}]}
                 }
             },
             {
@@ -491,66 +755,37 @@ class DBManager:
             }
         ]
         results = self.aggregate(pipeline)
-        # calculate the number of rts, rps, and qts
-        # compute the users' interactions
+        # count the interactions of each user with the others, one
+        # document per author, interacted user and type of interaction
+        pipeline = [
+            {
+                '$match': match
+            },
+            {
+                '$project': {
+                    'author': '$tweet_obj.user.id_str',
+                    'interaction_type': interaction_type,
+                    'interacted_user': interacted_users
+                }
+            },
+            {
+                '$unwind': '$interacted_user'
+            },
+            {
+                '$group': {
+                    '_id': {'author': '$author', 'interacted_user': '$interacted_user',
+                            'interaction_type': '$interaction_type'},
+                    'count': {'$sum': 1}
+                }
+            }
+        ]
+        users_interactions = defaultdict(lambda: defaultdict(dict))
+        for doc in self.aggregate_iter(pipeline):
+            interaction = users_interactions[doc['_id']['author']][doc['_id']['interacted_user']]
+            interaction[doc['_id']['interaction_type']] = doc['count']
+            interaction['total'] = interaction.get('total', 0) + doc['count']
         for result in results:
-            ret_tweets = result['tweets']
-            rt_count = 0
-            qt_count = 0
-            rp_count = 0
-            interactions = defaultdict(dict)
-            for tweet in ret_tweets:
-                if 'retweet' in tweet.keys():
-                    rt_count += 1
-                    user_id = tweet['retweeted_user_id']
-                    if user_id in interactions.keys():
-                        interactions[user_id]['total'] += 1
-                        if 'retweets' in interactions[user_id].keys():
-                            interactions[user_id]['retweets'] += 1
-                        else:
-                            interactions[user_id].update({'retweets': 1})
-                    else:
-                        interactions[user_id] = {'retweets': 1, 'total': 1}
-                elif 'quote' in tweet.keys():
-                    qt_count += 1
-                    user_id = tweet['quoted_user_id']
-                    if user_id in interactions.keys():
-                        interactions[user_id]['total'] += 1
-                        if 'quotes' in interactions[user_id].keys():
-                            interactions[user_id]['quotes'] += 1
-                        else:
-                            interactions[user_id].update({'quotes': 1})
-                    else:
-                        interactions[user_id] = {'quotes': 1, 'total': 1}
-                elif tweet['reply'] or tweet['replied_user_id']:
-                    rp_count += 1
-                    user_id = tweet['replied_user_id']
-                    if user_id in interactions.keys():
-                        interactions[user_id]['total'] += 1
-                        if 'replies' in interactions[user_id].keys():
-                            interactions[user_id]['replies'] += 1
-                        else:
-                            interactions[user_id].update({'replies': 1})
-                    else:
-                        interactions[user_id] = {'replies': 1, 'total': 1}
-                else:
-                    if 'mentions' in tweet.keys():
-                        mentions = tweet['mentions']
-                        for mention in mentions:
-                            user_id = mention['screen_name']
-                            if user_id in interactions.keys():
-                                interactions[user_id]['total'] += 1
-                                if 'mentions' in interactions[user_id].keys():
-                                    interactions[user_id]['mentions'] += 1
-                                else:
-                                    interactions[user_id].update({'mentions': 1})
-                            else:
-                                interactions[user_id] = {'mentions': 1, 'total': 1}
-            result['retweets_count'] = rt_count
-            result['quotes_count'] = qt_count
-            result['replies_count'] = rp_count
-            result['original_count'] = result['tweets_count'] - (rt_count+qt_count+rp_count)
-            result['interactions'] = interactions
+            result['interactions'] = users_interactions[result['_id']]
         return results
 
     def get_id_duplicated_tweets(self):
@@ -583,23 +818,15 @@ class DBManager:
             'time_zone': {'$first': '$tweet_obj.user.time_zone'},
             'count': {'$sum': 1}
         }
-        if 'partido' in kwargs.keys():
-            match.update({'flag.partido_politico.'+kwargs['partido']: {'$gt': 0}})
-            group.update({'partido_politico': {'$push': '$flag.partido_politico'}})
-        if 'movimiento' in kwargs.keys():
-            match.update({'flag.movimiento.'+kwargs['movimiento']: {'$gt': 0}})
-            group.update({'movimiento': {'$push': '$flag.movimiento'}})
-        if 'limited_to_time_window' in kwargs.keys():
-            match.update({'extraction_date': {'$in': kwargs['limited_to_time_window']}})
+        match = self.__add_dominant_domain_filters(match, **kwargs)
+        self.__add_time_filters(match, **kwargs)
         pipeline = [
             {'$match': match},
             {'$group': group},
             {'$sort': {'count': -1}}
         ]
-        result_docs = self.aggregate(pipeline)
-        if 'partido' in kwargs.keys() or 'movimiento' in kwargs.keys():
-            return self.update_counts(result_docs, **kwargs)
-        return result_docs
+        pipeline.extend(self.__domain_info_stages(**kwargs))
+        return self.aggregate(pipeline)
 
     def get_movement_user(self, username):
         match = {
@@ -673,23 +900,15 @@ class DBManager:
             group.update({'_id': '$tweet_obj.place.country'})
         else:
             group.update({'_id': '$tweet_obj.user.time_zone'})
-        if 'partido' in kwargs.keys():
-            match.update({'flag.partido_politico.'+kwargs['partido']: {'$gt': 0}})
-            group.update({'partido_politico': {'$push': '$flag.partido_politico'}})
-        if 'movimiento' in kwargs.keys():
-            match.update({'flag.movimiento.'+kwargs['movimiento']: {'$gt': 0}})
-            group.update({'movimiento': {'$push': '$flag.movimiento'}})
-        if 'limited_to_time_window' in kwargs.keys():
-            match.update({'extraction_date': {'$in': kwargs['limited_to_time_window']}})
+        match = self.__add_dominant_domain_filters(match, **kwargs)
+        self.__add_time_filters(match, **kwargs)
         pipeline = [
             {'$match': match},
             {'$group': group},
             {'$sort': {'count': -1}}
         ]
-        result_docs = self.aggregate(pipeline)
-        if 'partido' in kwargs.keys() or 'movimiento' in kwargs.keys():
-            return self.update_counts(result_docs, **kwargs)
-        return result_docs
+        pipeline.extend(self.__domain_info_stages(**kwargs))
+        return self.aggregate(pipeline)
 
     def get_tweets_by_date(self, **kwargs):
         match = {
@@ -713,10 +932,8 @@ class DBManager:
                     {'$project': project},
                     {'$sort': {'date': 1}}
                     ]
-        result_docs = self.aggregate(pipeline)
-        if 'partido' in kwargs.keys() or 'movimiento' in kwargs.keys():
-            return self.update_counts(result_docs, **kwargs)
-        return result_docs
+        pipeline.extend(self.__domain_info_stages(**kwargs))
+        return self.aggregate(pipeline)
 
     def get_tweets_by_hour(self, interested_date, **kwargs):
         match = {
@@ -737,69 +954,29 @@ class DBManager:
                     {'$project': project},
                     {'$sort': {'hour': 1}}
                     ]
-        result_docs = self.aggregate(pipeline)
-        if 'partido' in kwargs.keys() or 'movimiento' in kwargs.keys():
-            return self.update_counts(result_docs, **kwargs)
-        return result_docs
-
-    def update_counts(self, result_docs, **kwargs):
-        # update tweet counts that mention more other movements/political parties
-        # than the movement/party given
-        tweets_updated = []
-        for doc in result_docs:
-            keys = doc.keys()
-            if 'partido' in kwargs.keys():
-                parties = doc['partido_politico']
-                max_party = {}
-                for dict_party in parties:
-                    for party, count in dict_party.items():
-                        if not max_party or max_party['count'] < count:
-                            max_party['party'] = party
-                            max_party['count'] = count
-                        elif max_party['count'] == count:
-                            if max_party['party'].lower() != kwargs['partido'].lower():
-                                max_party['party'] = kwargs['partido']
-                if max_party['party'].lower() != kwargs['partido'].lower():
-                    doc['count'] -= 1
-            if 'movimiento' in kwargs.keys():
-                movements = doc['movimiento']
-                max_movement = {}
-                for dict_movement in movements:
-                    for movement, count in dict_movement.items():
-                        if not max_movement or max_movement['count'] < count:
-                            max_movement['movement'] = movement
-                            max_movement['count'] = count
-                        elif max_movement['count'] == count:
-                            if max_movement['movement'].lower() != kwargs['movimiento'].lower():
-                                max_movement['movement'] = kwargs['movimiento']
-                if max_movement['movement'].lower() != kwargs['movimiento'].lower():
-                    doc['count'] -= 1
-            tweet_updated = {}
-            for key in keys:
-                if key != 'partido_politico' and key != 'movimiento':
-                    tweet_updated[key] = doc[key]
-            tweet_updated.update(kwargs)
-            tweets_updated.append(tweet_updated)
-        return tweets_updated
+        pipeline.extend(self.__domain_info_stages(**kwargs))
+        return self.aggregate(pipeline)
 
     def get_tweets_user(self, username):
         match = {
             'relevante': {'$eq': 1},
             'tweet_obj.user.screen_name': {'$eq': username}
         }
-        project = {
-            '_id': 0,
-            'tweet': '$tweet_obj',
-            'screen_name': '$tweet_obj.user.screen_name'
-        }
+        # only the fields used to classify the tweets are fetched
+        project = {'_id': 0}
+        for field in ['id_str', 'text', 'full_text', 'in_reply_to_status_id_str', 'in_reply_to_user_id_str']:
+            project['tweet_obj.' + field] = 1
+        for status in ['retweeted_status', 'quoted_status']:
+            for field in ['id_str', 'text', 'full_text', 'user.screen_name']:
+                project['tweet_obj.' + status + '.' + field] = 1
         pipeline = [
             {'$match': match},
             {'$project': project}
         ]
-        search_results = self.aggregate(pipeline)
+        search_results = self.aggregate_iter(pipeline)
         results = {'rts': [], 'qts': [], 'rps': [], 'ori': []}
         for result in search_results:
-            tweet = result['tweet']
+            tweet = result['tweet_obj']
             if 'full_text' in tweet.keys():
                 text_tweet = tweet['full_text']
             else:
@@ -859,20 +1036,31 @@ class DBManager:
         return self.aggregate(pipeline)
 
     def get_posting_frequency_in_seconds(self, **kwargs):
+        """
+        Get the relevant tweets sorted by publication day with the seconds
+        between the day of each tweet and the day of the previous one. Days are
+        taken from tweet_py_datetime_native, tweet_py_date is parsed only for the
+        tweets that don't have it yet (see data_wrangler.add_native_dates_attr)
+        """
         match = {'relevante': {'$eq': 1}}
         if 'partido' in kwargs.keys():
-            match.update({'flag.partido_politico.' + kwargs['partido']: {'$gt': 0}})
+            self.__add_flag_condition(match, 'flag_parties', '$all', kwargs['partido'])
         if 'movimiento' in kwargs.keys():
-            match.update({'flag.movimiento.' + kwargs['movimiento']: {'$gt': 0}})
+            self.__add_flag_condition(match, 'flag_movements', '$all', kwargs['movimiento'])
         if 'no_movimiento' in kwargs.keys():
-            match.update({'flag.movimiento.' + kwargs['no_movimiento']: {'$eq': 0}})
+            self.__add_flag_condition(match, 'flag_movements', '$nin', kwargs['no_movimiento'])
         pipeline = [
             {'$match': match},
             {'$project': {
                'id_str': '$tweet_obj.id_str',
-               'datetime': {'$dateFromString': {
-                    'dateString': '$tweet_py_date'
-                }},
+               'datetime': {'$ifNull': [
+                    {'$dateFromParts': {
+                        'year': {'$year': '$tweet_py_datetime_native'},
+                        'month': {'$month': '$tweet_py_datetime_native'},
+                        'day': {'$dayOfMonth': '$tweet_py_datetime_native'}
+                    }},
+                    {'$dateFromString': {'dateString': '$tweet_py_date'}}
+               ]},
                '_id': 0,
             }},
             {'$sort': {'datetime': 1}}
@@ -890,72 +1078,62 @@ class DBManager:
         return ret_agg
 
     def interactions_user_over_time(self, user_screen_name, **kwargs):
+        return self.interactions_users_over_time([user_screen_name], **kwargs)[user_screen_name]
+
+    def interactions_users_over_time(self, user_screen_names, **kwargs):
+        """
+        Get the number of replies, quotes and retweets received by each user
+        per day, the three series of all the users are computed in a single scan
+        :param user_screen_names: list of screen names of the users
+        :return: dictionary with the list of daily counts of each user, ordered
+        by type of interaction (reply, quote and retweet) and date
+        """
+        interacted_fields = [('reply', 'tweet_obj.in_reply_to_screen_name'),
+                             ('quote', 'tweet_obj.quoted_status.user.screen_name'),
+                             ('retweet', 'tweet_obj.retweeted_status.user.screen_name')]
         match = {
             'relevante': {'$eq': 1},
-            'tweet_obj.user.screen_name': {'$ne': user_screen_name}
-        }
-        group = {
-            '_id': '$tweet_py_date',
-            'num_tweets': {'$sum': 1}
+            '$or': [{field: {'$in': user_screen_names}} for _, field in interacted_fields]
         }
-        project = {
-            'date': {
-                '$dateFromString': {
-                    'dateString': '$_id'
-                }
-            },
-            'count': '$num_tweets'
-        }
-        # replies
-        rp_match = {'tweet_obj.in_reply_to_screen_name': {'$eq': user_screen_name}}
-        rp_match.update(match)
-        rp_project = {'type': 'reply'}
-        rp_project.update(project)
-        pipeline = [{'$match': rp_match},
-                    {'$group': group},
-                    {'$project': rp_project},
-                    {'$sort': {'date': 1}}]
-        results = self.aggregate(pipeline)
-        # quotes
-        qt_match = {'tweet_obj.quoted_status.user.screen_name': {'$eq': user_screen_name}}
-        qt_match.update(match)
-        qt_project = {'type': 'quote'}
-        qt_project.update(project)
-        pipeline = [{'$match': qt_match},
-                    {'$group': group},
-                    {'$project': qt_project},
-                    {'$sort': {'date': 1}}]
-        results.extend(self.aggregate(pipeline))
-        # retweets
-        rt_match = {'tweet_obj.retweeted_status.user.screen_name': {'$eq': user_screen_name}}
-        rt_match.update(match)
-        rt_project = {'type': 'retweet'}
-        rt_project.update(project)
-        pipeline = [{'$match': rt_match},
-                    {'$group': group},
-                    {'$project': rt_project},
-                    {'$sort': {'date': 1}}]
-        results.extend(self.aggregate(pipeline))
+        facets = {}
+        for interaction_type, field in interacted_fields:
+            facets[interaction_type] = [
+                {'$match': {field: {'$in': user_screen_names},
+                            # discard the interactions of users with themselves
+                            '$expr': {'$ne': ['$tweet_obj.user.screen_name', '$' + field]}}},
+                {'$group': {'_id': {'user': '$' + field, 'date': '$tweet_py_date'},
+                            'num_tweets': {'$sum': 1}}},
+                {'$project': {'_id': '$_id.date',
+                              'user': '$_id.user',
+                              'type': interaction_type,
+                              'date': {'$dateFromString': {'dateString': '$_id.date'}},
+                              'count': '$num_tweets'}},
+                {'$sort': {'date': 1}}
+            ]
+        pipeline = [{'$match': match},
+                    {'$facet': facets}]
+        series = self.aggregate(pipeline)[0]
+        results = {user_screen_name: [] for user_screen_name in user_screen_names}
+        for interaction_type, _ in interacted_fields:
+            for doc in series[interaction_type]:
+                results[doc.pop('user')].append(doc)
         return results
 
-    def add_tweet(self, tweet, type_k, extraction_date, flag):
+    def add_tweet(self, tweet, type_k, extraction_date, flag, relevance=None):
         """
         Save a tweet in the database
         :param tweet: dictionary in json format of the tweet
         :param type_k: string, take the value 'user' or 'hashtag'
         :param extraction_date: string, date (dd/mm/yyyy) when the tweet was collected
         :param k_metadata: dictionary, metadata about the keyword
+        :param relevance: int, 1 if the tweet is relevant 0 otherwise, if None the
+        relevance is left to be computed by TweetEvaluator.identify_relevant_tweets
         :return:
         """
-        enriched_tweet = {'type': type_k,
-                          'tweet_obj': tweet,
-                          'extraction_date': extraction_date}
-        enriched_tweet.update(flag)
         id_tweet = tweet['id_str']
         num_results = self.search({'tweet_obj.id_str': id_tweet}, only_relevant_tws=False).count()
         if num_results == 0:
-            py_date = datetime.strftime(get_py_date(tweet), '%m/%d/%y')
-            enriched_tweet.update({'tweet_py_date': py_date})
+            enriched_tweet = self.create_tweet_record(tweet, type_k, extraction_date, flag, relevance)
             self.save_record(enriched_tweet)
             logging.info('Inserted tweet: {0}'.format(id_tweet))
             return True
@@ -963,40 +1141,144 @@ class DBManager:
             logging.info('Tweet not inserted because num_results = {0}'.format(num_results))
             return False
 
-    def get_tweets_reduced(self, filters={}, projection={}):        
-        results = self.find_all(filters, projection)
-        reduced_tweets = []
-        special_keys = ['retweeted_status', 'is_quote_status',
-                        'in_reply_to_status_id_str']
-        for tweet in results:
-            reduced_tweet = {}
-            if 'type' in projection and 'type' not in tweet:
-                if 'retweeted_status' in tweet:
-                    reduced_tweet['type'] = 'rt'
-                elif 'is_quote_status' in tweet and tweet['is_quote_status']:
-                    reduced_tweet['type'] = 'qt'
-                elif 'in_reply_to_status_id_str' in tweet and tweet['in_reply_to_status_id_str']:
-                    reduced_tweet['type'] = 'rp'
-                else:
-                    reduced_tweet['type'] = 'og'
-            for key, value in tweet.items():
-                if key not in special_keys:
-                    if isinstance(value, dict):
-                        for k, v in value.items():
-                            combined_key = key + '_' + k
-                            reduced_tweet[combined_key] = tweet[key][k]
-                    else:
-                        reduced_tweet[key] = tweet[key]
-            reduced_tweets.append(reduced_tweet)
-        
-        return reduced_tweets
+    @staticmethod
+    def create_tweet_record(tweet, type_k, extraction_date, flag, relevance=None):
+        """
+        Build the document of a tweet as it is stored in the database, including
+        the attributes that compute_tweets_local_date, add_complete_text_attr and
+        add_tweet_type_attr add to tweets stored without them
+        :param tweet: dictionary in json format of the tweet
+        :param type_k: string, take the value 'user' or 'hashtag'
+        :param extraction_date: string, date (dd/mm/yyyy) when the tweet was collected
+        :param flag: dictionary, flags of the tweet
+        :param relevance: int, 1 if the tweet is relevant 0 otherwise
+        :return: dictionary with the tweet and its additional attributes
+        """
+        enriched_tweet = {'type': type_k,
+                          'tweet_obj': tweet,
+                          'extraction_date': extraction_date}
+        enriched_tweet.update(flag)
+        py_pub_dt = get_py_date(tweet)
+        enriched_tweet.update({
+            'tweet_py_datetime': datetime.strftime(py_pub_dt, '%m/%d/%y %H:%M:%S'),
+            'tweet_py_date': datetime.strftime(py_pub_dt, '%m/%d/%y'),
+            'tweet_py_hour': datetime.strftime(py_pub_dt, '%H')
+        })
+        enriched_tweet.update(get_native_dates(py_pub_dt, extraction_date))
+        org_tweet = tweet if 'retweeted_status' not in tweet else tweet['retweeted_status']
+        tweet['complete_text'] = get_tweet_text(org_tweet)
+        tweet['type'] = get_tweet_type(tweet)
+        if relevance is not None:
+            enriched_tweet['relevante'] = relevance
+        return enriched_tweet
+
+    def ensure_indexes(self):
+        """
+        Create the indexes of the collection declared in INDEXES. Indexes
+        that already exist are left untouched
+        :return: list with the names of the indexes of the collection that are ready
+        """
+        ready_indexes = []
+        for index in INDEXES.get(self.__collection, []):
+            try:
+                name = self.__db[self.__collection].create_index(index['keys'], **index.get('options', {}))
+                ready_indexes.append(name)
+                logging.info('Index {0} of the collection {1} is ready'.format(name, self.__collection))
+            except OperationFailure as e:
+                logging.error('Could not create the index {0} in the collection {1}. '
+                              'Error: {2}'.format(index['keys'], self.__collection, e))
+        return ready_indexes
+
+    def explain_query(self, query):
+        """
+        Run a query and report how the server executed it
+        :param query: dictionary, filter of the query
+        :return: dictionary with the time taken by the query, the number of documents
+        returned and examined, and the stages of the winning plan (e.g., FETCH > IXSCAN)
+        """
+        start = time.time()
+        explanation = self.__db[self.__collection].find(query).explain()
+        stats = {'query': query, 'secs': round(time.time() - start, 4)}
+        stats.update(summarize_explanation(explanation))
+        return stats
+
+    def create_unique_tweet_index(self):
+        """
+        Create a unique index on the id of the tweets, it is required
+        to store tweets in bulk with add_tweets
+        """
+        try:
+            return self.__db[self.__collection].create_index('tweet_obj.id_str', unique=True)
+        except OperationFailure as e:
+            logging.error('Could not create the unique index on tweet_obj.id_str, the collection '
+                          'might contain duplicated tweets (see get_id_duplicated_tweets). Error: {0}'.format(e))
+            raise
+
+    def add_tweets(self, enriched_tweets):
+        """
+        Save a batch of tweets in the database using an unordered bulk insert.
+        Tweets already stored are rejected by the unique index on tweet_obj.id_str
+        (see create_unique_tweet_index) and counted as duplicates
+        :param enriched_tweets: list of tweet documents built with create_tweet_record
+        :return: tuple with the number of inserted tweets and the number of duplicated tweets
+        """
+        if not enriched_tweets:
+            return 0, 0
+        try:
+            ret = self.__db[self.__collection].insert_many(enriched_tweets, ordered=False)
+            num_inserted, num_duplicated = len(ret.inserted_ids), 0
+        except BulkWriteError as e:
+            write_errors = e.details['writeErrors']
+            # 11000 is the code of duplicate key errors
+            other_errors = [write_error for write_error in write_errors if write_error['code'] != 11000]
+            if other_errors:
+                logging.error('Error when inserting tweets: {0}'.format(other_errors))
+                raise
+            num_inserted, num_duplicated = e.details['nInserted'], len(write_errors)
+        logging.info('Inserted {0} tweets, {1} were already stored'.format(num_inserted, num_duplicated))
+        return num_inserted, num_duplicated
+
+    def get_tweets_reduced(self, filters={}, projection={}, columns=None, chunk_size=10000):
+        """
+        Get the tweets as a DataFrame with a column for each of the projected
+        fields, named after their paths (e.g., tweet_obj.user.screen_name is
+        tweet_obj_user_screen_name) and typed as in TWEET_COLUMNS. Tweets are
+        converted to columns in chunks, so memory is bounded by the chunk size
+        :param filters: dictionary, filter of the query
+        :param projection: dictionary, fields to return, if empty the columns are TWEET_COLUMNS
+        :param columns: list of tuples (name, path, type) that replaces the columns of the projection
+        :param chunk_size: number of tweets converted at once
+        :return: DataFrame
+        """
+        # imported here so that the modules that don't build DataFrames don't need pandas
+        from src.utils.dataframes import get_dataframe
+        if not columns:
+            types = {path: column_type for _, path, column_type in TWEET_COLUMNS}
+            columns = [(field.replace('.', '_'), field, types.get(field, 'object'))
+                       for field, include in projection.items() if include and field != '_id']
+            columns = columns or TWEET_COLUMNS
+        projection = {path: 1 for _, path, _ in columns}
+        tweets = self.__db[self.__collection].find(filters, projection).batch_size(chunk_size)
+        return get_dataframe(tweets, columns, chunk_size)
+
+    def buffered_updater(self, max_size=1000, max_secs=60):
+        """
+        Get a BufferedUpdater of the collection, e.g.,
+            with dbm.buffered_updater() as updater:
+                for doc in docs:
+                    updater.update_one({'_id': doc['_id']}, new_values)
+        :param max_size: maximum number of operations in the buffer
+        :param max_secs: maximum number of seconds between writes
+        :return: BufferedUpdater
+        """
+        return BufferedUpdater(self.__db[self.__collection], max_size, max_secs, self.__update_types)
 
     def bulk_update(self, update_queries):
         # create list of objects to update
         update_objs = []
         for update_query in update_queries:
             update_objs.append(
-                UpdateOne(
+                self.__update_types[0](
                             update_query['filter'], 
                             {'$set': update_query['new_values']}
                           )
@@ -0,0 +1,295 @@
+import atexit
+import csv
+import logging
+import os
+import pathlib
+import sys
+import threading
+import time
+
+from collections import defaultdict
+
+
+logging.basicConfig(filename=str(pathlib.Path(__file__).parents[1].joinpath('politic_bots.log')), level=logging.DEBUG)
+
+
+# environment variable that enables the profiler regardless of the configuration
+PROFILER_ENV_VAR = 'POLITIC_BOTS_QUERY_PROFILER'
+# methods of the collections that are profiled
+PROFILED_METHODS = ['find', 'find_one', 'aggregate', 'update_one', 'update_many', 'bulk_write']
+# methods of the cursors that return the cursor itself
+CHAINED_CURSOR_METHODS = ['sort', 'skip', 'limit', 'batch_size', 'hint', 'max_time_ms']
+
+
+def summarize_explanation(explanation):
+    """
+    Extract the number of documents returned and examined, and the
+    stages of the winning plan from the output of explain
+
+    :param explanation: dictionary returned by explain
+    :return: dictionary with the keys returned, docs_examined, keys_examined and plan
+    """
+    if 'stages' in explanation:
+        # explain of an aggregation, the plan is the one of its first stage
+        explanation = explanation['stages'][0].get('$cursor', {})
+    stats = explanation.get('executionStats', {})
+    plan = explanation.get('queryPlanner', {}).get('winningPlan', {})
+    stages = []
+    while plan:
+        stages.append(plan['stage'])
+        plan = plan.get('inputStage')
+    return {
+        'returned': stats.get('nReturned'),
+        'docs_examined': stats.get('totalDocsExamined'),
+        'keys_examined': stats.get('totalKeysExamined'),
+        'plan': ' > '.join(stages)
+    }
+
+
+class QueryProfiler:
+    """
+    Record the duration of the operations run on the collections grouped by
+    the method that called them. Operations slower than the threshold are
+    explained to get the documents examined and the plan used by the server
+
+    :param threshold_ms: duration, in milliseconds, from which an operation is explained
+    :param summary_file: csv file where the summary is saved at exit
+    """
+    fieldnames = ['caller', 'operation', 'calls', 'slow_calls', 'total_secs', 'max_secs', 'docs_returned',
+                  'docs_examined', 'plans']
+
+    def __init__(self, threshold_ms=100, summary_file=None):
+        self.threshold_ms = threshold_ms
+        self.summary_file = summary_file
+        self.__lock = threading.Lock()
+        self.__stats = {}
+
+    @staticmethod
+    def get_caller():
+        # first frame outside this module, usually a method of DBManager
+        frame = sys._getframe(1)
+        while frame and frame.f_code.co_filename == __file__:
+            frame = frame.f_back
+        if not frame:
+            return 'unknown'
+        return '{0}.{1}'.format(pathlib.Path(frame.f_code.co_filename).stem, frame.f_code.co_name)
+
+    def record(self, caller, operation, secs, num_docs=None, explain=None):
+        """
+        Record an operation
+
+        :param caller: name of the method that ran the operation
+        :param operation: name of the method of the collection
+        :param secs: duration of the operation
+        :param num_docs: number of documents returned
+        :param explain: function that explains the operation, called only if it was slow
+        """
+        explanation = None
+        if explain and secs*1000 >= self.threshold_ms:
+            try:
+                explanation = summarize_explanation(explain())
+            except Exception as e:
+                logging.warning('Could not explain the operation {0} of {1}. Error: {2}'.format(operation, caller, e))
+        with self.__lock:
+            stats = self.__stats.setdefault((caller, operation), {
+                'caller': caller, 'operation': operation, 'calls': 0, 'slow_calls': 0, 'total_secs': 0.0,
+                'max_secs': 0.0, 'docs_returned': 0, 'docs_examined': 0, 'plans': defaultdict(int)
+            })
+            stats['calls'] += 1
+            stats['total_secs'] += secs
+            stats['max_secs'] = max(stats['max_secs'], secs)
+            stats['docs_returned'] += num_docs or 0
+            if secs*1000 >= self.threshold_ms:
+                stats['slow_calls'] += 1
+                if explanation:
+                    stats['docs_examined'] += explanation['docs_examined'] or 0
+                    stats['plans'][explanation['plan']] += 1
+        if explanation:
+            logging.debug('Slow operation {0} of {1} ({2:.3f} secs): {3}'.format(operation, caller, secs,
+                                                                                 explanation))
+
+    def summary(self):
+        # callers sorted by the total time spent in their operations
+        with self.__lock:
+            rows = []
+            for stats in self.__stats.values():
+                row = dict(stats)
+                row['total_secs'] = round(row['total_secs'], 3)
+                row['max_secs'] = round(row['max_secs'], 3)
+                row['plans'] = '; '.join('{0} ({1})'.format(plan, count) for plan, count in stats['plans'].items())
+                rows.append(row)
+        return sorted(rows, key=lambda row: row['total_secs'], reverse=True)
+
+    def save(self):
+        summary = self.summary()
+        for row in summary:
+            logging.info('Query profile of {caller} ({operation}): {calls} calls, {slow_calls} slow, '
+                         '{total_secs} secs, max {max_secs} secs, plans: {plans}'.format(**row))
+        if self.summary_file:
+            with open(str(self.summary_file), 'w', encoding='utf-8') as f:
+                writer = csv.DictWriter(f, fieldnames=self.fieldnames)
+                writer.writeheader()
+                for row in summary:
+                    writer.writerow(row)
+            logging.info('Saved the query profile in {0}'.format(self.summary_file))
+
+
+class ProfiledCursor:
+    """
+    Cursor, of find or aggregate, that records the time spent fetching its
+    documents once it is exhausted, closed or discarded
+
+    :param operation: name of the method of the collection that returned the cursor
+    :param secs: time spent until the cursor was returned, e.g., the first batch of aggregate
+    """
+    def __init__(self, cursor, profiler, caller, explain, operation='find', secs=0.0):
+        self.__cursor = cursor
+        self.__profiler = profiler
+        self.__caller = caller
+        self.__explain = explain
+        self.__operation = operation
+        self.__secs = secs
+        self.__num_docs = 0
+        self.__recorded = False
+
+    def __getattr__(self, name):
+        attr = getattr(self.__cursor, name)
+        if name in CHAINED_CURSOR_METHODS:
+            def chained(*args, **kwargs):
+                attr(*args, **kwargs)
+                return self
+            return chained
+        if name == 'count':
+            def count(*args, **kwargs):
+                start = time.time()
+                ret = attr(*args, **kwargs)
+                self.__profiler.record(self.__caller, 'count', time.time()-start)
+                return ret
+            return count
+        return attr
+
+    def __getitem__(self, index):
+        start = time.time()
+        ret = self.__cursor[index]
+        self.__profiler.record(self.__caller, self.__operation, time.time()-start, 1, self.__explain)
+        return ret
+
+    def __iter__(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __next__(self):
+        start = time.time()
+        try:
+            doc = next(self.__cursor)
+        except StopIteration:
+            self.__secs += time.time()-start
+            self.__finish()
+            raise
+        self.__secs += time.time()-start
+        self.__num_docs += 1
+        return doc
+
+    def close(self):
+        self.__cursor.close()
+        self.__finish()
+
+    def __finish(self):
+        if not self.__recorded:
+            self.__recorded = True
+            self.__profiler.record(self.__caller, self.__operation, self.__secs, self.__num_docs, self.__explain)
+
+    def __del__(self):
+        # cursors of find that were never read didn't run the query
+        if self.__num_docs or self.__secs:
+            self.__finish()
+
+
+class ProfiledCollection:
+    """
+    Collection whose operations are recorded by a QueryProfiler
+    """
+    def __init__(self, collection, profiler):
+        self.__collection = collection
+        self.__profiler = profiler
+
+    def __getattr__(self, name):
+        attr = getattr(self.__collection, name)
+        if name not in PROFILED_METHODS:
+            return attr
+
+        def profiled(*args, **kwargs):
+            caller = self.__profiler.get_caller()
+            explain = self.__get_explain(name, args, kwargs)
+            start = time.time()
+            ret = attr(*args, **kwargs)
+            if name == 'find':
+                # documents are fetched while the cursor is consumed
+                return ProfiledCursor(ret, self.__profiler, caller, explain)
+            if name == 'aggregate':
+                # the first batch is returned with the cursor, the rest while it is consumed
+                return ProfiledCursor(ret, self.__profiler, caller, explain, name, time.time()-start)
+            num_docs = 1 if name == 'find_one' and ret else None
+            self.__profiler.record(caller, name, time.time()-start, num_docs, explain)
+            return ret
+        return profiled
+
+    def __get_explain(self, name, args, kwargs):
+        collection = self.__collection
+        if name in ['find', 'find_one', 'update_one', 'update_many']:
+            query = args[0] if args else kwargs.get('filter', {})
+            return lambda: collection.find(query).limit(1 if name in ['find_one', 'update_one'] else 0).explain()
+        if name == 'aggregate':
+            pipeline = args[0] if args else kwargs['pipeline']
+            return lambda: collection.database.command('aggregate', collection.name, pipeline=pipeline,
+                                                       explain=True)
+        return None
+
+
+class ProfiledDatabase:
+    """
+    Database whose collections are profiled
+    """
+    def __init__(self, db, profiler):
+        self.__db = db
+        self.__profiler = profiler
+
+    def __getitem__(self, collection):
+        return ProfiledCollection(self.__db[collection], self.__profiler)
+
+    def __getattr__(self, name):
+        return getattr(self.__db, name)
+
+
+# profiler shared by all the DBManager instances of the process
+__profiler = None
+__profiler_lock = threading.Lock()
+
+
+def get_query_profiler(config, config_dir):
+    """
+    Get the profiler of the process if it is enabled, either in the
+    configuration (query_profiler.enabled) or with the environment variable
+    POLITIC_BOTS_QUERY_PROFILER. The summary is saved when the process exits
+
+    :param config: dictionary with the configuration
+    :param config_dir: directory of the configuration file, where the summary is saved
+    :return: QueryProfiler or None if profiling is disabled
+    """
+    global __profiler
+    profiler_config = config.get('query_profiler', {})
+    if not profiler_config.get('enabled') and not os.environ.get(PROFILER_ENV_VAR):
+        return None
+    with __profiler_lock:
+        if not __profiler:
+            summary_file = pathlib.Path(config_dir).joinpath(profiler_config.get('summary_file', 'query_profile.csv'))
+            __profiler = QueryProfiler(profiler_config.get('threshold_ms', 100), summary_file)
+            atexit.register(__profiler.save)
+            logging.info('Profiling the queries, operations slower than {0} ms are explained'.
+                         format(__profiler.threshold_ms))
+        return __profiler
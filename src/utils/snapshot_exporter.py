@@ -0,0 +1,125 @@
+import logging
+import pathlib
+import pyarrow as pa
+import pyarrow.parquet as pq
+import time
+
+from collections import defaultdict, OrderedDict
+from src.utils.db_manager import DBManager
+from src.utils.utils import TWEET_COLUMNS, USER_COLUMNS, get_column_values
+
+
+logging.basicConfig(filename=str(pathlib.Path(__file__).parents[1].joinpath('politic_bots.log')), level=logging.DEBUG)
+
+
+ARROW_TYPES = {
+    'int64': pa.int64(),
+    'float64': pa.float64(),
+    'bool': pa.bool_(),
+    'string': pa.string(),
+    'date': pa.date32(),
+    'datetime': pa.timestamp('s'),
+    'list': pa.list_(pa.string())
+}
+# value of the partitions of the documents without date or party
+UNKNOWN_PARTITION = 'unknown'
+# values used by the analyses for unknown parties (e.g., author_party = -1)
+UNKNOWN_VALUES = ['', '-1', 'desconocido']
+# maximum number of partition files open at the same time
+MAX_OPEN_FILES = 256
+
+
+def get_partition_value(value):
+    value = str(value) if value is not None else ''
+    return UNKNOWN_PARTITION if value.lower() in UNKNOWN_VALUES else value.replace('/', '-')
+
+
+class SnapshotExporter:
+    """
+    Export the collections of tweets and users to Parquet datasets with typed
+    columns, partitioned by date and party (directories date=.../party=...).
+    Documents are read in chunks, so memory is bounded by the chunk size. Each
+    partition is written to a single file, whose writer is kept open while the
+    partition receives documents, every chunk adds a row group to it
+
+    :param output_dir: directory where the datasets tweets and users are written
+    :param chunk_size: number of documents of each chunk
+    :param max_open_files: maximum number of partition files open at the same
+    time, when a closed partition receives documents again a new file is created
+    """
+    def __init__(self, output_dir, chunk_size=100000, max_open_files=MAX_OPEN_FILES):
+        self.output_dir = pathlib.Path(output_dir)
+        self.chunk_size = chunk_size
+        self.max_open_files = max_open_files
+        # writers of the partitions, the least recently used first
+        self.__writers = OrderedDict()
+        self.__num_files = defaultdict(int)
+
+    @staticmethod
+    def __to_table(values, rows, columns):
+        arrays = [pa.array([values[name][row] for row in rows], type=ARROW_TYPES[column_type])
+                  for name, _, column_type in columns]
+        return pa.Table.from_arrays(arrays, names=[name for name, _, _ in columns])
+
+    def __get_writer(self, partition_dir, schema):
+        if partition_dir in self.__writers:
+            self.__writers.move_to_end(partition_dir)
+            return self.__writers[partition_dir]
+        if len(self.__writers) >= self.max_open_files:
+            _, writer = self.__writers.popitem(last=False)
+            writer.close()
+        partition_dir.mkdir(parents=True, exist_ok=True)
+        file_name = partition_dir.joinpath('part-{0}.parquet'.format(self.__num_files[partition_dir]))
+        self.__num_files[partition_dir] += 1
+        self.__writers[partition_dir] = pq.ParquetWriter(str(file_name), schema)
+        return self.__writers[partition_dir]
+
+    def __close_writers(self):
+        while self.__writers:
+            _, writer = self.__writers.popitem(last=False)
+            writer.close()
+
+    def __write_chunk(self, docs, columns, partitions, dataset_dir):
+        values = get_column_values(docs, columns)
+        # rows of each partition, the partition columns are given by the directories
+        rows = defaultdict(list)
+        for row, key in enumerate(zip(*[values[partition] for partition in partitions])):
+            rows[tuple(get_partition_value(value) for value in key)].append(row)
+        data_columns = [column for column in columns if column[0] not in partitions]
+        for key, partition_rows in rows.items():
+            partition_dir = dataset_dir.joinpath(*['{0}={1}'.format(partition, value)
+                                                   for partition, value in zip(partitions, key)])
+            table = self.__to_table(values, partition_rows, data_columns)
+            self.__get_writer(partition_dir, table.schema).write_table(table)
+
+    def __export(self, collection, columns, partitions):
+        start = time.time()
+        dataset_dir = self.output_dir.joinpath(collection)
+        projection = {path: 1 for _, path, _ in columns}
+        num_docs = 0
+        try:
+            for page in DBManager(collection).iter_pages(page_size=self.chunk_size, projection=projection):
+                self.__write_chunk(page, columns, partitions, dataset_dir)
+                num_docs += len(page)
+                logging.info('Exported {0} documents of the collection {1}'.format(num_docs, collection))
+        finally:
+            self.__close_writers()
+        logging.info('Exported the collection {0} to {1} in {2:.2f} seconds, {3} files were written'.
+                     format(collection, dataset_dir, time.time()-start,
+                            sum(num_files for partition_dir, num_files in self.__num_files.items()
+                                if dataset_dir in partition_dir.parents)))
+        return num_docs
+
+    def export_tweets(self):
+        return self.__export('tweets', TWEET_COLUMNS, ['date', 'party'])
+
+    def export_users(self):
+        return self.__export('users', USER_COLUMNS, ['party'])
+
+    def export(self):
+        """
+        Export the tweets and users
+
+        :return: dictionary with the number of documents exported of each collection
+        """
+        return {'tweets': self.export_tweets(), 'users': self.export_users()}
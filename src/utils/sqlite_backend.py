@@ -0,0 +1,915 @@
+import logging
+import os
+import pathlib
+import re
+import sqlite3
+import threading
+
+from bson import ObjectId, json_util
+from bson.json_util import JSONOptions
+from collections import OrderedDict
+from datetime import datetime
+from pymongo import ASCENDING
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+
+
+logging.basicConfig(filename=str(pathlib.Path(__file__).parents[1].joinpath('politic_bots.log')), level=logging.DEBUG)
+
+
+# Embedded storage backend that keeps each collection in a table of a SQLite file,
+# one JSON document per row. It implements the subset of the pymongo API used by
+# DBManager, so analyses can run over a snapshot of the database without a server.
+# Queries and pipelines are evaluated in Python; equality on indexed fields, ranges
+# on _id and sorts by _id are run by SQLite, as well as skip and limit when SQLite
+# runs the whole query
+
+JSON_OPTIONS = JSONOptions(tz_aware=False)
+DATE_FORMATS = ['%m/%d/%y', '%m/%d/%Y', '%m/%d/%y %H:%M:%S', '%Y-%m-%d', '%Y-%m-%dT%H:%M:%S',
+                '%Y-%m-%d %H:%M:%S']
+PATTERN_TYPE = type(re.compile(''))
+# comparisons of _id run by SQLite
+SQL_OPERATORS = OrderedDict([('$eq', '='), ('$gt', '>'), ('$gte', '>='), ('$lt', '<'), ('$lte', '<=')])
+# number of rows read from SQLite at once
+FETCH_SIZE = 1000
+
+
+class Missing:
+    # value of the fields that don't exist, unlike None (null)
+    def __repr__(self):
+        return 'MISSING'
+
+
+MISSING = Missing()
+
+
+def sort_key(value):
+    # key that orders values of different types as MongoDB does
+    if value is MISSING:
+        return 0, 0
+    if value is None:
+        return 1, 0
+    if isinstance(value, bool):
+        return 8, value
+    if isinstance(value, (int, float)):
+        return 2, value
+    if isinstance(value, str):
+        return 3, value
+    if isinstance(value, dict):
+        return 4, [(k, sort_key(v)) for k, v in value.items()]
+    if isinstance(value, list):
+        return 5, [sort_key(v) for v in value]
+    if isinstance(value, ObjectId):
+        return 7, str(value)
+    if isinstance(value, datetime):
+        return 9, value
+    return 10, str(value)
+
+
+def compare(a, b):
+    key_a, key_b = sort_key(a), sort_key(b)
+    return (key_a > key_b) - (key_a < key_b)
+
+
+def is_true(value):
+    return value not in [False, None, 0] and value is not MISSING
+
+
+def get_values(value, parts):
+    """
+    Values reached by a dotted path in a document, as in the queries of
+    MongoDB the arrays found along the path are traversed
+    """
+    if not parts:
+        return [value]
+    if isinstance(value, dict):
+        return get_values(value[parts[0]], parts[1:]) if parts[0] in value else []
+    if isinstance(value, list):
+        if parts[0].isdigit():
+            index = int(parts[0])
+            return get_values(value[index], parts[1:]) if index < len(value) else []
+        values = []
+        for item in value:
+            if isinstance(item, dict):
+                values.extend(get_values(item, parts))
+        return values
+    return []
+
+
+def get_field(value, path):
+    # value of a field path ($a.b) in an expression, arrays are mapped
+    for part in path.split('.'):
+        if isinstance(value, dict):
+            value = value.get(part, MISSING)
+        elif isinstance(value, list):
+            value = [v for v in (get_field(item, part) for item in value if isinstance(item, dict))
+                     if v is not MISSING]
+        else:
+            return MISSING
+        if value is MISSING:
+            return MISSING
+    return value
+
+
+def set_field(doc, path, value):
+    parts = path.split('.')
+    for part in parts[:-1]:
+        if not isinstance(doc.get(part), dict):
+            doc[part] = {}
+        doc = doc[part]
+    doc[parts[-1]] = value
+
+
+def unset_field(doc, path):
+    parts = path.split('.')
+    for part in parts[:-1]:
+        doc = doc.get(part)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(parts[-1], None)
+
+
+def copy_field(src, dst, parts):
+    # copy a dotted field of src into dst, used by inclusion projections
+    if isinstance(src, list):
+        if not isinstance(dst, list):
+            dst = [{} for item in src if isinstance(item, dict)]
+        items = [item for item in src if isinstance(item, dict)]
+        for item, item_dst in zip(items, dst):
+            copy_field(item, item_dst, parts)
+        return dst
+    if not isinstance(src, dict) or parts[0] not in src:
+        return dst
+    if len(parts) == 1:
+        dst[parts[0]] = src[parts[0]]
+    else:
+        value = src[parts[0]]
+        if isinstance(value, (dict, list)):
+            dst[parts[0]] = copy_field(value, dst.get(parts[0], {} if isinstance(value, dict) else None), parts[1:])
+    return dst
+
+
+def project(doc, projection):
+    """
+    Apply a projection ($project stage or projection of find) to a document
+    """
+    fields = {k: v for k, v in projection.items() if k != '_id'}
+    exclusion = fields and all(v in [0, False] for v in fields.values()) or \
+        (not fields and projection.get('_id') in [0, False])
+    if exclusion:
+        result = json_util.loads(json_util.dumps(doc), json_options=JSON_OPTIONS)
+        for field in projection.keys():
+            unset_field(result, field)
+        return result
+    result = {}
+    if projection.get('_id', 1) not in [0, False] and '_id' in doc:
+        if projection.get('_id', 1) in [1, True]:
+            result['_id'] = doc['_id']
+        else:
+            value = evaluate(projection['_id'], doc)
+            if value is not MISSING:
+                result['_id'] = value
+    for field, spec in fields.items():
+        if spec in [1, True]:
+            copy_field(doc, result, field.split('.'))
+        else:
+            value = evaluate(spec, doc)
+            if value is not MISSING:
+                set_field(result, field, value)
+    return result
+
+
+# Queries
+
+
+def candidates(values):
+    # values compared in a query, arrays are compared as a whole and by element
+    items = []
+    for value in values:
+        items.append(value)
+        if isinstance(value, list):
+            items.extend(value)
+    return items
+
+
+def equals(values, target):
+    if target is None:
+        return not values or any(value is None for value in candidates(values))
+    if isinstance(target, PATTERN_TYPE):
+        return any(isinstance(value, str) and target.search(value) for value in candidates(values))
+    # booleans are not equal to numbers in MongoDB
+    return any(value == target and isinstance(value, bool) == isinstance(target, bool)
+               for value in candidates(values))
+
+
+def compare_values(values, target, accepted):
+    # comparisons only match values of the same type, as in MongoDB
+    rank = sort_key(target)[0]
+    return any(sort_key(value)[0] == rank and compare(value, target) in accepted for value in candidates(values))
+
+
+def match_condition(values, condition):
+    if not (isinstance(condition, dict) and condition and all(k.startswith('$') for k in condition.keys())):
+        return equals(values, condition)
+    for operator, arg in condition.items():
+        if operator == '$eq':
+            matched = equals(values, arg)
+        elif operator == '$ne':
+            matched = not equals(values, arg)
+        elif operator == '$gt':
+            matched = compare_values(values, arg, [1])
+        elif operator == '$gte':
+            matched = compare_values(values, arg, [0, 1])
+        elif operator == '$lt':
+            matched = compare_values(values, arg, [-1])
+        elif operator == '$lte':
+            matched = compare_values(values, arg, [-1, 0])
+        elif operator == '$in':
+            matched = any(equals(values, item) for item in arg)
+        elif operator == '$nin':
+            matched = not any(equals(values, item) for item in arg)
+        elif operator == '$exists':
+            matched = bool(values) == is_true(arg)
+        elif operator == '$size':
+            matched = any(isinstance(value, list) and len(value) == arg for value in values)
+        elif operator == '$all':
+            matched = all(equals(values, item) for item in arg)
+        elif operator == '$regex':
+            pattern = re.compile(arg, re.IGNORECASE if 'i' in condition.get('$options', '') else 0)
+            matched = equals(values, pattern)
+        elif operator == '$options':
+            continue
+        elif operator == '$not':
+            matched = not match_condition(values, arg)
+        elif operator == '$elemMatch':
+            matched = any(isinstance(value, list) and
+                          any(match_document(item, arg) if isinstance(item, dict) else match_condition([item], arg)
+                              for item in value) for value in values)
+        else:
+            raise NotImplementedError('The query operator {0} is not supported by the SQLite backend'.
+                                      format(operator))
+        if not matched:
+            return False
+    return True
+
+
+def match_document(doc, query):
+    for key, condition in query.items():
+        if key == '$and':
+            matched = all(match_document(doc, sub_query) for sub_query in condition)
+        elif key == '$or':
+            matched = any(match_document(doc, sub_query) for sub_query in condition)
+        elif key == '$nor':
+            matched = not any(match_document(doc, sub_query) for sub_query in condition)
+        elif key == '$expr':
+            matched = is_true(evaluate(condition, doc))
+        else:
+            matched = match_condition(get_values(doc, key.split('.')), condition)
+        if not matched:
+            return False
+    return True
+
+
+# Expressions
+
+
+def parse_date(date_string):
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(date_string, date_format)
+        except (ValueError, TypeError):
+            continue
+    raise ValueError('Could not parse the date {0}'.format(date_string))
+
+
+def accumulate(values, function):
+    values = [value for value in values if value is not MISSING and value is not None]
+    return function(values, key=sort_key) if values else None
+
+
+def evaluate_operator(operator, args, doc, variables):
+    def ev(arg):
+        return evaluate(arg, doc, variables)
+
+    if operator in ['$eq', '$ne', '$gt', '$gte', '$lt', '$lte']:
+        result = compare(ev(args[0]), ev(args[1]))
+        return {'$eq': result == 0, '$ne': result != 0, '$gt': result > 0, '$gte': result >= 0,
+                '$lt': result < 0, '$lte': result <= 0}[operator]
+    if operator == '$and':
+        return all(is_true(ev(arg)) for arg in args)
+    if operator == '$or':
+        return any(is_true(ev(arg)) for arg in args)
+    if operator == '$not':
+        return not is_true(ev(args[0] if isinstance(args, list) else args))
+    if operator == '$cond':
+        if isinstance(args, dict):
+            args = [args['if'], args['then'], args['else']]
+        return ev(args[1]) if is_true(ev(args[0])) else ev(args[2])
+    if operator == '$switch':
+        for branch in args['branches']:
+            if is_true(ev(branch['case'])):
+                return ev(branch['then'])
+        return ev(args['default'])
+    if operator == '$ifNull':
+        value = ev(args[0])
+        return ev(args[1]) if value is None or value is MISSING else value
+    if operator == '$literal':
+        return args
+    if operator in ['$add', '$multiply']:
+        values = [ev(arg) for arg in args]
+        if any(value is None or value is MISSING for value in values):
+            return None
+        result = 0 if operator == '$add' else 1
+        for value in values:
+            result = result + value if operator == '$add' else result * value
+        return result
+    if operator in ['$subtract', '$divide']:
+        a, b = ev(args[0]), ev(args[1])
+        if a is None or b is None or a is MISSING or b is MISSING:
+            return None
+        if operator == '$divide':
+            return a / b
+        if isinstance(a, datetime) and isinstance(b, datetime):
+            return int((a - b).total_seconds() * 1000)
+        return a - b
+    if operator in ['$max', '$min']:
+        function = max if operator == '$max' else min
+        if isinstance(args, list) and len(args) != 1:
+            return accumulate([ev(arg) for arg in args], function)
+        value = ev(args[0] if isinstance(args, list) else args)
+        return accumulate(value if isinstance(value, list) else [value], function)
+    if operator == '$sum':
+        value = ev(args) if not isinstance(args, list) else [ev(arg) for arg in args]
+        values = value if isinstance(value, list) else [value]
+        return sum(v for v in values if isinstance(v, (int, float)) and not isinstance(v, bool))
+    if operator == '$size':
+        return len(ev(args[0] if isinstance(args, list) else args))
+    if operator == '$in':
+        value, array = ev(args[0]), ev(args[1])
+        return any(compare(value, item) == 0 for item in array)
+    if operator == '$objectToArray':
+        value = ev(args)
+        return [{'k': k, 'v': v} for k, v in value.items()] if isinstance(value, dict) else None
+    if operator == '$map':
+        items = ev(args['input'])
+        if not isinstance(items, list):
+            return None
+        name = args.get('as', 'this')
+        return [evaluate(args['in'], doc, dict(variables or {}, **{name: item})) for item in items]
+    if operator == '$concat':
+        values = [ev(arg) for arg in args]
+        return None if any(not isinstance(value, str) for value in values) else ''.join(values)
+    if operator in ['$toLower', '$toUpper']:
+        value = ev(args[0] if isinstance(args, list) else args)
+        value = '' if value is None or value is MISSING else str(value)
+        return value.lower() if operator == '$toLower' else value.upper()
+    if operator == '$dateFromString':
+        return parse_date(ev(args['dateString']))
+    if operator in ['$year', '$month', '$dayOfMonth']:
+        value = ev(args[0] if isinstance(args, list) else args)
+        if not isinstance(value, datetime):
+            return None
+        return {'$year': value.year, '$month': value.month, '$dayOfMonth': value.day}[operator]
+    if operator == '$dateFromParts':
+        parts = {part: ev(arg) for part, arg in args.items()}
+        if any(value is None or value is MISSING for value in parts.values()):
+            return None
+        return datetime(parts['year'], parts.get('month', 1), parts.get('day', 1), parts.get('hour', 0),
+                        parts.get('minute', 0), parts.get('second', 0))
+    raise NotImplementedError('The expression operator {0} is not supported by the SQLite backend'.format(operator))
+
+
+def evaluate(expr, doc, variables=None):
+    """
+    Evaluate an aggregation expression on a document
+    """
+    if isinstance(expr, str):
+        if expr.startswith('$$'):
+            name, _, path = expr[2:].partition('.')
+            value = doc if name in ['ROOT', 'CURRENT'] else (variables or {}).get(name, MISSING)
+            return get_field(value, path) if path else value
+        if expr.startswith('$'):
+            return get_field(doc, expr[1:])
+        return expr
+    if isinstance(expr, list):
+        return [evaluate(item, doc, variables) for item in expr]
+    if isinstance(expr, dict):
+        if len(expr) == 1 and next(iter(expr)).startswith('$'):
+            operator, args = next(iter(expr.items()))
+            return evaluate_operator(operator, args, doc, variables)
+        result = {}
+        for key, value in expr.items():
+            value = evaluate(value, doc, variables)
+            if value is not MISSING:
+                result[key] = value
+        return result
+    return expr
+
+
+# Pipelines
+
+
+def sort_documents(docs, sort_spec):
+    docs = list(docs)
+    # stable sorts from the last key to the first
+    for key, direction in reversed(sort_spec):
+        docs.sort(key=lambda doc: sort_key(get_field(doc, key)), reverse=direction < 0)
+    return docs
+
+
+def group_documents(docs, spec):
+    groups = OrderedDict()
+    for doc in docs:
+        group_id = evaluate(spec['_id'], doc)
+        group_id = None if group_id is MISSING else group_id
+        group_key = json_util.dumps(group_id)
+        if group_key not in groups:
+            groups[group_key] = {'_id': group_id, 'values': {field: [] for field in spec if field != '_id'}}
+        for field, accumulator in spec.items():
+            if field != '_id':
+                operator, expr = next(iter(accumulator.items()))
+                groups[group_key]['values'][field].append(evaluate(expr, doc))
+    for group in groups.values():
+        result = {'_id': group['_id']}
+        for field, accumulator in spec.items():
+            if field == '_id':
+                continue
+            operator = next(iter(accumulator.keys()))
+            values = group['values'][field]
+            present = [value for value in values if value is not MISSING]
+            if operator == '$sum':
+                result[field] = sum(v for v in values if isinstance(v, (int, float)) and not isinstance(v, bool))
+            elif operator == '$avg':
+                numbers = [v for v in values if isinstance(v, (int, float)) and not isinstance(v, bool)]
+                result[field] = sum(numbers) / len(numbers) if numbers else None
+            elif operator == '$first':
+                result[field] = values[0] if values and values[0] is not MISSING else None
+            elif operator == '$last':
+                result[field] = values[-1] if values and values[-1] is not MISSING else None
+            elif operator == '$max':
+                result[field] = accumulate(values, max)
+            elif operator == '$min':
+                result[field] = accumulate(values, min)
+            elif operator == '$push':
+                result[field] = present
+            elif operator == '$addToSet':
+                result[field] = []
+                for value in present:
+                    if value not in result[field]:
+                        result[field].append(value)
+            else:
+                raise NotImplementedError('The accumulator {0} is not supported by the SQLite backend'.
+                                          format(operator))
+        yield result
+
+
+def unwind_documents(docs, spec):
+    if isinstance(spec, str):
+        spec = {'path': spec}
+    path = spec['path'][1:]
+    preserve = spec.get('preserveNullAndEmptyArrays', False)
+    for doc in docs:
+        value = get_field(doc, path)
+        if isinstance(value, list) and value:
+            for item in value:
+                unwound = dict(doc)
+                if '.' in path:
+                    unwound = json_util.loads(json_util.dumps(doc), json_options=JSON_OPTIONS)
+                set_field(unwound, path, item)
+                yield unwound
+        elif isinstance(value, list) or value is None or value is MISSING:
+            if preserve:
+                yield doc
+        else:
+            yield doc
+
+
+def run_stage(docs, name, spec):
+    if name == '$match':
+        return (doc for doc in docs if match_document(doc, spec))
+    if name == '$project':
+        return (project(doc, spec) for doc in docs)
+    if name in ['$addFields', '$set']:
+        return (dict(doc, **evaluate(spec, doc)) for doc in docs)
+    if name == '$group':
+        return group_documents(docs, spec)
+    if name == '$sort':
+        return iter(sort_documents(docs, list(spec.items())))
+    if name == '$unwind':
+        return unwind_documents(docs, spec)
+    if name == '$limit':
+        return (doc for _, doc in zip(range(spec), docs))
+    if name == '$skip':
+        return (doc for i, doc in enumerate(docs) if i >= spec)
+    if name == '$count':
+        num_docs = sum(1 for _ in docs)
+        return iter([{spec: num_docs}] if num_docs else [])
+    if name == '$facet':
+        docs = list(docs)
+        return iter([{facet: list(run_pipeline(iter(docs), sub_pipeline)) for facet, sub_pipeline in spec.items()}])
+    raise NotImplementedError('The stage {0} is not supported by the SQLite backend'.format(name))
+
+
+def run_pipeline(docs, pipeline):
+    """
+    Run the stages of an aggregation pipeline on an iterable of documents
+    """
+    for stage in pipeline:
+        name, spec = next(iter(stage.items()))
+        docs = run_stage(docs, name, spec)
+    return docs
+
+
+# Storage
+
+
+class WriteResult:
+    # result of the write operations, with the attributes of the results of pymongo
+    def __init__(self, matched_count=0, modified_count=0, upserted_ids=None, inserted_ids=None):
+        self.matched_count = matched_count
+        self.modified_count = modified_count
+        self.upserted_ids = upserted_ids or {}
+        self.upserted_count = len(self.upserted_ids)
+        self.upserted_id = next(iter(self.upserted_ids.values()), None)
+        self.inserted_ids = inserted_ids or []
+        self.bulk_api_result = {'nMatched': matched_count, 'nModified': modified_count,
+                                'nUpserted': self.upserted_count, 'nInserted': len(self.inserted_ids)}
+
+
+def apply_update(doc, update):
+    """
+    Apply an update ($set, $unset, $inc or a replacement) to a copy of a document
+    """
+    if not any(key.startswith('$') for key in update.keys()):
+        return dict(update, _id=doc['_id'])
+    doc = json_util.loads(json_util.dumps(doc), json_options=JSON_OPTIONS)
+    for operator, fields in update.items():
+        for path, value in fields.items():
+            if operator == '$set':
+                set_field(doc, path, value)
+            elif operator == '$unset':
+                unset_field(doc, path)
+            elif operator == '$inc':
+                current = get_field(doc, path)
+                set_field(doc, path, (0 if current is MISSING else current) + value)
+            else:
+                raise NotImplementedError('The update operator {0} is not supported by the SQLite backend'.
+                                          format(operator))
+    return doc
+
+
+class SQLiteUpdateOne:
+    """
+    Update of a document in a bulk_write, takes the same arguments as
+    UpdateOne of pymongo
+    """
+    def __init__(self, filter, update, upsert=False):
+        self.filter = filter
+        self.update = update
+        self.upsert = upsert
+
+
+class SQLiteUpdateMany(SQLiteUpdateOne):
+    """
+    Update of all the documents that match the filter in a bulk_write
+    """
+    pass
+
+
+class SQLiteCursor:
+    """
+    Lazy result of find, documents are read from SQLite while it is consumed
+    """
+    def __init__(self, collection, query, projection):
+        self.__collection = collection
+        self.__query = query
+        self.__projection = projection
+        self.__sort = []
+        self.__skip = 0
+        self.__limit = 0
+        self.__docs = None
+
+    def sort(self, key_or_list, direction=ASCENDING):
+        self.__sort = [(key_or_list, direction)] if isinstance(key_or_list, str) else list(key_or_list)
+        return self
+
+    def skip(self, num_docs):
+        self.__skip = num_docs
+        return self
+
+    def limit(self, num_docs):
+        self.__limit = num_docs
+        return self
+
+    def batch_size(self, num_docs):
+        return self
+
+    def count(self, with_limit_and_skip=False):
+        num_docs = sum(1 for _ in self.__collection.find_documents(self.__query))
+        if with_limit_and_skip:
+            num_docs = max(num_docs - self.__skip, 0)
+            num_docs = min(num_docs, self.__limit) if self.__limit else num_docs
+        return num_docs
+
+    def explain(self):
+        return {'queryPlanner': {'winningPlan': {'stage': 'SQLITE'}}}
+
+    def close(self):
+        self.__docs = iter([])
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.__docs is None:
+            self.__docs = self.__collection.find_documents(self.__query, self.__sort, self.__skip, self.__limit)
+            if self.__projection:
+                self.__docs = (project(doc, self.__projection) for doc in self.__docs)
+        return next(self.__docs)
+
+    def __getitem__(self, index):
+        docs = self.__collection.find_documents(self.__query, self.__sort, self.__skip + index, 1)
+        for doc in docs:
+            return project(doc, self.__projection) if self.__projection else doc
+        raise IndexError('no such item for Cursor instance')
+
+
+class SQLiteCollection:
+    """
+    Collection stored in a table of SQLite, each row holds the _id and the
+    JSON (extended JSON of bson) of a document
+    """
+    def __init__(self, database, name):
+        self.database = database
+        self.name = name
+        self.__connection = database.connection
+        self.__lock = database.lock
+        self.__table = '"{0}"'.format(name.replace('"', ''))
+        with self.__lock, self.__connection:
+            self.__connection.execute('CREATE TABLE IF NOT EXISTS {0} (id INTEGER PRIMARY KEY, oid TEXT UNIQUE, '
+                                      'doc TEXT)'.format(self.__table))
+        self.__indexed_fields = database.get_indexed_fields(name)
+
+    # Reads
+
+    def __sql_conditions(self, query, conditions, params):
+        # conditions run by SQLite, the documents they return are a superset of
+        # the ones that match the query, which is checked afterwards in Python.
+        # Returns True if the conditions are exactly the query
+        exact = True
+        for key, condition in query.items():
+            if key == '$and':
+                for sub_query in condition:
+                    exact = self.__sql_conditions(sub_query, conditions, params) and exact
+            elif key == '_id':
+                if isinstance(condition, ObjectId):
+                    conditions.append('oid = ?')
+                    params.append(str(condition))
+                elif isinstance(condition, dict):
+                    for operator, sql_operator in SQL_OPERATORS.items():
+                        if isinstance(condition.get(operator), ObjectId):
+                            conditions.append('oid {0} ?'.format(sql_operator))
+                            params.append(str(condition[operator]))
+                    exact = exact and all(operator in SQL_OPERATORS and isinstance(value, ObjectId)
+                                          for operator, value in condition.items())
+                else:
+                    exact = False
+            elif key in self.__indexed_fields:
+                if isinstance(condition, dict) and list(condition.keys()) == ['$eq']:
+                    condition = condition['$eq']
+                if isinstance(condition, (str, int, float)) and not isinstance(condition, bool):
+                    path = '$.' + key
+                    conditions.append('(json_extract(doc, ?) = ? OR json_type(doc, ?) = \'array\')')
+                    params.extend([path, condition, path])
+                # arrays are matched by element in Python
+                exact = False
+            else:
+                exact = False
+        return exact
+
+    def __read_rows(self, cursor):
+        # rows are read in batches, the lock is not held while they are consumed
+        while True:
+            with self.__lock:
+                rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                return
+            for row in rows:
+                yield row
+
+    def find_documents(self, query=None, sort=None, skip=0, limit=0):
+        """
+        Generator of the documents that match a query
+        """
+        query = query or {}
+        conditions, params = [], []
+        exact = self.__sql_conditions(query, conditions, params)
+        sql = 'SELECT doc FROM {0}'.format(self.__table)
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sort = sort or []
+        sorted_by_id = len(sort) == 1 and sort[0][0] == '_id'
+        sql += ' ORDER BY oid {0}'.format('DESC' if sort[0][1] < 0 else 'ASC') if sorted_by_id else ' ORDER BY id'
+        # skip and limit are run by SQLite if it runs the whole query and sort,
+        # so a page only reads its own rows
+        if exact and (not sort or sorted_by_id) and (skip or limit):
+            sql += ' LIMIT ? OFFSET ?'
+            params.extend([limit or -1, skip])
+            skip, limit = 0, 0
+        with self.__lock:
+            cursor = self.__connection.execute(sql, params)
+        try:
+            docs = (json_util.loads(row[0], json_options=JSON_OPTIONS) for row in self.__read_rows(cursor))
+            if not exact:
+                docs = (doc for doc in docs if match_document(doc, query))
+            if sort and not sorted_by_id:
+                docs = iter(sort_documents(docs, sort))
+            for i, doc in enumerate(docs):
+                if i < skip:
+                    continue
+                if limit and i >= skip + limit:
+                    return
+                yield doc
+        finally:
+            cursor.close()
+
+    def find(self, filter=None, projection=None, **kwargs):
+        return SQLiteCursor(self, filter or {}, projection)
+
+    def find_one(self, filter=None, projection=None, **kwargs):
+        for doc in self.find(filter, projection).limit(1):
+            return doc
+        return None
+
+    def count_documents(self, filter, **kwargs):
+        return sum(1 for _ in self.find_documents(filter))
+
+    def aggregate(self, pipeline, **kwargs):
+        # the first $match is also used to select the rows
+        query = pipeline[0]['$match'] if pipeline and '$match' in pipeline[0] else {}
+        # iterator that can be closed, as the CommandCursor of pymongo
+        return (doc for doc in run_pipeline(self.find_documents(query), pipeline))
+
+    # Writes
+
+    def __insert(self, doc):
+        if '_id' not in doc:
+            doc['_id'] = ObjectId()
+        self.__connection.execute('INSERT INTO {0} (oid, doc) VALUES (?, ?)'.format(self.__table),
+                                  (str(doc['_id']), json_util.dumps(doc)))
+        return doc['_id']
+
+    def insert_one(self, document):
+        try:
+            with self.__lock, self.__connection:
+                return WriteResult(inserted_ids=[self.__insert(document)])
+        except sqlite3.IntegrityError as e:
+            raise DuplicateKeyError(str(e), 11000)
+
+    def insert_many(self, documents, ordered=True, **kwargs):
+        inserted_ids, write_errors = [], []
+        with self.__lock, self.__connection:
+            for index, doc in enumerate(documents):
+                try:
+                    inserted_ids.append(self.__insert(doc))
+                except sqlite3.IntegrityError as e:
+                    write_errors.append({'index': index, 'code': 11000, 'errmsg': str(e), 'op': doc})
+                    if ordered:
+                        break
+        if write_errors:
+            raise BulkWriteError({'writeErrors': write_errors, 'nInserted': len(inserted_ids), 'nUpserted': 0,
+                                  'nMatched': 0, 'nModified': 0, 'nRemoved': 0, 'upserted': [],
+                                  'writeConcernErrors': []})
+        return WriteResult(inserted_ids=inserted_ids)
+
+    def insert(self, doc_or_docs, **kwargs):
+        if isinstance(doc_or_docs, list):
+            return self.insert_many(doc_or_docs).inserted_ids
+        return self.insert_one(doc_or_docs).inserted_ids[0]
+
+    def __update(self, filter, update, upsert, many):
+        matched, modified, upserted_ids = 0, 0, {}
+        for doc in list(self.find_documents(filter, limit=0 if many else 1)):
+            matched += 1
+            updated_doc = apply_update(doc, update)
+            if updated_doc != doc:
+                modified += 1
+                self.__connection.execute('UPDATE {0} SET oid = ?, doc = ? WHERE oid = ?'.format(self.__table),
+                                          (str(updated_doc['_id']), json_util.dumps(updated_doc), str(doc['_id'])))
+        if not matched and upsert:
+            # the new document takes the fields of the filter that are compared by equality
+            doc = {}
+            for key, condition in filter.items():
+                if not key.startswith('$') and not (isinstance(condition, dict) and
+                                                     any(k.startswith('$') for k in condition.keys())):
+                    set_field(doc, key, condition)
+            doc['_id'] = doc.get('_id', ObjectId())
+            upserted_ids[0] = self.__insert(apply_update(doc, update))
+        return matched, modified, upserted_ids
+
+    def __write(self, filter, update, upsert, many):
+        try:
+            with self.__lock, self.__connection:
+                matched, modified, upserted_ids = self.__update(filter, update, upsert, many)
+        except sqlite3.IntegrityError as e:
+            raise DuplicateKeyError(str(e), 11000)
+        return WriteResult(matched, modified, upserted_ids)
+
+    def update_one(self, filter, update, upsert=False, **kwargs):
+        return self.__write(filter, update, upsert, False)
+
+    def update_many(self, filter, update, upsert=False, **kwargs):
+        return self.__write(filter, update, upsert, True)
+
+    def bulk_write(self, requests, ordered=True, **kwargs):
+        # requests are SQLiteUpdateOne and SQLiteUpdateMany operations
+        matched, modified, upserted_ids = 0, 0, {}
+        with self.__lock, self.__connection:
+            for index, request in enumerate(requests):
+                if not isinstance(request, SQLiteUpdateOne):
+                    raise TypeError('{0} is not an update operation of the SQLite backend'.format(request))
+                try:
+                    ret = self.__update(request.filter, request.update, request.upsert,
+                                        isinstance(request, SQLiteUpdateMany))
+                except sqlite3.IntegrityError as e:
+                    raise DuplicateKeyError(str(e), 11000)
+                matched += ret[0]
+                modified += ret[1]
+                if ret[2]:
+                    upserted_ids[index] = ret[2][0]
+        return WriteResult(matched, modified, upserted_ids)
+
+    def __delete(self, filter, many):
+        with self.__lock, self.__connection:
+            docs = list(self.find_documents(filter, limit=0 if many else 1))
+            for doc in docs:
+                self.__connection.execute('DELETE FROM {0} WHERE oid = ?'.format(self.__table), (str(doc['_id']),))
+        return len(docs)
+
+    def delete_one(self, filter, **kwargs):
+        return self.__delete(filter, False)
+
+    def delete_many(self, filter, **kwargs):
+        return self.__delete(filter, True)
+
+    def remove(self, spec_or_id=None, **kwargs):
+        return self.__delete(spec_or_id or {}, True)
+
+    def create_index(self, keys, unique=False, **kwargs):
+        """
+        Create an index of SQLite on the JSON fields, the options of the partial
+        and sparse indexes of MongoDB are ignored
+        """
+        keys = [(keys, ASCENDING)] if isinstance(keys, str) else list(keys)
+        name = '_'.join('{0}_{1}'.format(field, direction) for field, direction in keys)
+        columns = ', '.join("json_extract(doc, '$.{0}')".format(field.replace("'", '')) for field, _ in keys)
+        try:
+            with self.__lock, self.__connection:
+                self.__connection.execute('CREATE {0}INDEX IF NOT EXISTS "{1}_{2}" ON {3} ({4})'.format(
+                    'UNIQUE ' if unique else '', self.name, name, self.__table, columns))
+        except sqlite3.IntegrityError as e:
+            raise OperationFailure(str(e), 11000)
+        self.__indexed_fields.update(field for field, _ in keys)
+        return name
+
+
+class SQLiteDatabase:
+    """
+    SQLite file holding the collections of a database
+    """
+    def __init__(self, file_name):
+        self.file_name = str(file_name)
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(self.file_name, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.__collections = {}
+
+    def __getitem__(self, name):
+        with self.lock:
+            if name not in self.__collections:
+                self.__collections[name] = SQLiteCollection(self, name)
+            return self.__collections[name]
+
+    def get_indexed_fields(self, collection):
+        # fields of the indexes created in previous runs
+        rows = self.connection.execute("SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ?",
+                                       (collection,)).fetchall()
+        fields = set()
+        for row in rows:
+            if row[0]:
+                fields.update(re.findall(r"json_extract\(doc, '\$\.([^']+)'\)", row[0]))
+        return fields
+
+
+# databases opened by the process, indexed by process and file name
+__databases = {}
+__databases_lock = threading.Lock()
+
+
+def get_sqlite_database(file_name):
+    key = (os.getpid(), str(file_name))
+    with __databases_lock:
+        if key not in __databases:
+            logging.info('Opening the SQLite database {0}'.format(file_name))
+            __databases[key] = SQLiteDatabase(file_name)
+        return __databases[key]
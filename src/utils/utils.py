@@ -1,8 +1,11 @@
+import copy
 import csv
 import json
 import logging
+import os
 import pathlib
 import re
+import threading
 import time
 
 from datetime import datetime, timedelta, tzinfo
@@ -19,6 +22,28 @@ def get_config(config_file):
     return config
 
 
+# Configurations already read, indexed by file name
+__configs = {}
+__configs_lock = threading.Lock()
+
+
+def get_cached_config(config_file):
+    """
+    Get the configuration from the file, which is read again only if it
+    was modified since the last time it was read
+
+    :param config_file: name of the configuration file
+    :return: copy of the configuration
+    """
+    config_file = str(config_file)
+    mtime = os.path.getmtime(config_file)
+    with __configs_lock:
+        if config_file not in __configs or __configs[config_file][0] != mtime:
+            __configs[config_file] = (mtime, get_config(config_file))
+        config = __configs[config_file][1]
+    return copy.deepcopy(config)
+
+
 def update_config(config_file, new_data):
     json_file = open(config_file, 'w+')
     json_file.write(json.dumps(new_data))
@@ -42,7 +67,7 @@ def parse_metadata(file_name):
 def get_user_handlers_and_hashtags():
     script_parent_dir = pathlib.Path(__file__).parents[1]
     config_fn = script_parent_dir.joinpath('config.json')
-    configuration = get_config(config_fn)
+    configuration = get_cached_config(config_fn)
     hashtags_file = script_parent_dir.joinpath('tweet_collector', configuration['metadata'])
     keywords, _ = parse_metadata(hashtags_file)
     user_handlers, hashtags = [], []
@@ -83,6 +108,22 @@ def get_py_date(tweet):
     return pub_dt.astimezone(PYT)
 
 
+def get_native_dates(py_pub_dt, extraction_date):
+    """
+    Get the dates of a tweet as datetimes, unlike the strings tweet_py_date
+    and extraction_date they can be queried by range
+
+    :param py_pub_dt: datetime when the tweet was published, as returned by get_py_date
+    :param extraction_date: string, date (mm/dd/yy) when the tweet was collected
+    :return: dictionary with the datetimes tweet_py_datetime_native and extraction_dt
+    """
+    return {
+        # the local time is kept, as in tweet_py_datetime
+        'tweet_py_datetime_native': py_pub_dt.replace(tzinfo=None),
+        'extraction_dt': datetime.strptime(extraction_date, '%m/%d/%y')
+    }
+
+
 def clean_emojis(doc):
     emoji_pattern = re.compile("["
         "\U0001F600-\U0001F64F"  # emoticons
@@ -144,6 +185,32 @@ def get_video_config_with_user_bearer(user_bearer, status_id):
     return conn.getresponse()
 
 
+def get_tweet_text(tweet):
+    try:
+        if 'extended_tweet' in tweet:
+            tweet_txt = tweet['extended_tweet']['full_text']
+        elif 'full_text' in tweet:
+            tweet_txt = tweet['full_text']
+        else:
+            tweet_txt = tweet['text']
+        return tweet_txt
+    except Exception as e:
+        logging.error('Exception {}'.format(e))
+        logging.info(tweet)
+
+
+def get_tweet_type(tweet):
+    if 'retweeted_status' in tweet:
+        tweet_type = 'retweet'
+    elif 'is_quote_status' in tweet and tweet['is_quote_status']:
+        tweet_type = 'quote'
+    elif 'in_reply_to_status_id_str' in tweet and tweet['in_reply_to_status_id_str']:
+        tweet_type = 'reply'
+    else:
+        tweet_type = 'original'
+    return tweet_type
+
+
 def calculate_remaining_execution_time(start_time, total_segs, 
                                        processing_records, total_records):
     end_time = time.time()
@@ -158,6 +225,100 @@ def calculate_remaining_execution_time(start_time, total_segs,
     return total_segs
 
 
+# Columns of the tweets and users flattened to a fixed schema (see get_column_values):
+# name, path of the field in the documents and type
+TWEET_COLUMNS = [
+    ('id', 'tweet_obj.id_str', 'int64'),
+    ('user_id', 'tweet_obj.user.id_str', 'int64'),
+    ('screen_name', 'tweet_obj.user.screen_name', 'string'),
+    ('type', 'tweet_obj.type', 'string'),
+    ('text', 'tweet_obj.complete_text', 'string'),
+    ('date', 'tweet_py_date', 'date'),
+    ('published_at', 'tweet_py_datetime_native', 'datetime'),
+    ('extracted_at', 'extraction_dt', 'datetime'),
+    ('retweeted_id', 'tweet_obj.retweeted_status.id_str', 'int64'),
+    ('quoted_id', 'tweet_obj.quoted_status_id_str', 'int64'),
+    ('in_reply_to_id', 'tweet_obj.in_reply_to_status_id_str', 'int64'),
+    ('retweet_count', 'tweet_obj.retweet_count', 'int64'),
+    ('favorite_count', 'tweet_obj.favorite_count', 'int64'),
+    ('relevante', 'relevante', 'bool'),
+    ('flag_parties', 'flag_parties', 'list'),
+    ('flag_movements', 'flag_movements', 'list'),
+    ('flag_candidates', 'flag_candidates', 'list'),
+    ('sentiment_tone', 'sentimiento.tono', 'string'),
+    ('sentiment_score', 'sentimiento.score', 'float64'),
+    # party of the author, see UserPoliticalPreference
+    ('party', 'author_party', 'string'),
+    ('author_movement', 'author_movement', 'string'),
+    ('author_pbb', 'author_pbb', 'float64')
+]
+USER_COLUMNS = [
+    ('screen_name', 'screen_name', 'string'),
+    ('party', 'party', 'string'),
+    ('movement', 'movement', 'string'),
+    ('most_interacted_party', 'most_interacted_party', 'string'),
+    ('most_interacted_movement', 'most_interacted_movement', 'string'),
+    ('friends', 'friends', 'int64'),
+    ('followers', 'followers', 'int64'),
+    ('ff_ratio', 'ff_ratio', 'float64'),
+    ('tweets', 'tweets', 'int64'),
+    ('original_tweets', 'original_tweets', 'int64'),
+    ('rts', 'rts', 'int64'),
+    ('qts', 'qts', 'int64'),
+    ('rps', 'rps', 'int64'),
+    ('verified', 'verified', 'bool'),
+    ('pbb', 'bot_analysis.pbb', 'float64'),
+    ('raw_score', 'bot_analysis.raw_score', 'float64')
+]
+
+
+def convert_value(value, column_type):
+    # values missing or of the wrong type are converted to None
+    if value is None or value == '':
+        return None
+    try:
+        if column_type == 'int64':
+            return int(value)
+        if column_type == 'float64':
+            return float(value)
+        if column_type == 'bool':
+            return bool(value)
+        if column_type == 'string':
+            return str(value)
+        if column_type == 'date':
+            return datetime.strptime(value, '%m/%d/%y').date()
+        if column_type == 'datetime':
+            return value if isinstance(value, datetime) else None
+        if column_type == 'list':
+            return [str(item) for item in value] if isinstance(value, list) else None
+        if column_type == 'object':
+            return value
+    except (TypeError, ValueError):
+        return None
+    raise ValueError('Unknown column type {0}'.format(column_type))
+
+
+def get_column_values(docs, columns):
+    """
+    Flatten documents to a fixed schema, stored by column
+
+    :param docs: iterable of documents
+    :param columns: list of tuples (name, path, type) where path is the dotted
+    path of the field in the documents and type one of int64, float64, bool, string,
+    date (mm/dd/yy), datetime, list (of strings) or object (value kept as is)
+    :return: dictionary with a list of values for each column, None for the missing ones
+    """
+    values = {name: [] for name, _, _ in columns}
+    paths = [(name, path.split('.'), column_type) for name, path, column_type in columns]
+    for doc in docs:
+        for name, fields, column_type in paths:
+            value = doc
+            for field in fields:
+                value = value.get(field) if isinstance(value, dict) else None
+            values[name].append(convert_value(value, column_type))
+    return values
+
+
 if __name__ == '__main__':
     import http.client
     response = get_video_config_with_user_bearer("AAAAAAAAAAAAAAAAAAAAAIK1zgAAAAAA2tUWuhGZ2JceoId5GwYWU5GspY4%3DUq7gzFoCZs1QfwGoVdvSac3IniczZEYXIcDyumCauIXpcAPorE", "937374730281213952")
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Add the root of the repository to the sys.path, as run.py does
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
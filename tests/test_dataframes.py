@@ -0,0 +1,77 @@
+from datetime import date, datetime
+from unittest import mock
+
+import pandas as pd
+
+from src.utils.dataframes import get_dataframe
+from src.utils.utils import get_column_values
+
+
+COLUMNS = [
+    ('id', 'tweet_obj.id_str', 'int64'),
+    ('relevante', 'relevante', 'bool'),
+    ('date', 'tweet_py_date', 'date'),
+    ('score', 'sentimiento.score', 'float64')
+]
+
+
+def get_doc(id_str, relevante=True):
+    return {'tweet_obj': {'id_str': id_str}, 'relevante': relevante, 'tweet_py_date': '04/18/18',
+            'sentimiento': {'score': 0.5}}
+
+
+def test_column_values():
+    docs = [get_doc('1'), {'tweet_obj': {'id_str': 'abc'}, 'tweet_py_date': '', 'sentimiento': 'neutral'}]
+    values = get_column_values(docs, COLUMNS)
+    assert values == {'id': [1, None], 'relevante': [True, None], 'date': [date(2018, 4, 18), None],
+                      'score': [0.5, None]}
+
+
+def test_column_values_of_lists_and_datetimes():
+    columns = [('parties', 'flag_parties', 'list'), ('published_at', 'published_at', 'datetime')]
+    docs = [{'flag_parties': ['anr', 1], 'published_at': datetime(2018, 4, 18, 10)},
+            {'flag_parties': 'anr', 'published_at': '04/18/18'}]
+    values = get_column_values(docs, columns)
+    assert values == {'parties': [['anr', '1'], None], 'published_at': [datetime(2018, 4, 18, 10), None]}
+
+
+def test_dataframe_of_empty_cursor():
+    df = get_dataframe(iter([]), COLUMNS, chunk_size=2)
+    assert len(df) == 0
+    assert list(df.columns) == ['id', 'relevante', 'date', 'score']
+
+
+def test_dataframe_of_exact_multiple_of_chunk_size():
+    docs = [get_doc(str(i)) for i in range(4)]
+    with mock.patch('src.utils.dataframes.pd.concat', wraps=pd.concat) as concat:
+        df = get_dataframe(iter(docs), COLUMNS, chunk_size=2)
+    assert concat.call_count == 1
+    assert list(df['id']) == [0, 1, 2, 3]
+    assert list(df.index) == [0, 1, 2, 3]
+
+
+def test_dataframe_types():
+    df = get_dataframe([get_doc('1'), get_doc('2')], COLUMNS)
+    assert str(df['id'].dtype) == 'Int64'
+    assert df['relevante'].dtype == bool
+    assert pd.api.types.is_datetime64_dtype(df['date'])
+    assert df['score'].dtype == 'float64'
+
+
+def test_dataframe_with_missing_values():
+    docs = [get_doc('1'), {}, get_doc('3', relevante=False)]
+    df = get_dataframe(docs, COLUMNS, chunk_size=2)
+    assert str(df['id'].dtype) == 'Int64'
+    assert df['id'].isna().tolist() == [False, True, False]
+    assert df['relevante'].dtype == object
+    assert df['relevante'].tolist() == [True, None, False]
+    assert df['date'].isna().tolist() == [False, True, False]
+    assert df['score'].isna().tolist() == [False, True, False]
+
+
+def test_bool_column_without_missing_values_in_the_result():
+    # the chunks with and without missing values don't change the type
+    docs = [get_doc('1'), get_doc('2', relevante=False), get_doc('3')]
+    df = get_dataframe(docs, COLUMNS, chunk_size=2)
+    assert df['relevante'].dtype == bool
+    assert df['relevante'].tolist() == [True, False, True]
@@ -0,0 +1,55 @@
+import time
+
+from unittest import mock
+
+from src.utils.query_profiler import ProfiledCollection, QueryProfiler
+
+
+class FakeCommandCursor:
+    def __init__(self, docs, secs_per_doc=0.0):
+        self.docs = iter(docs)
+        self.secs_per_doc = secs_per_doc
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        time.sleep(self.secs_per_doc)
+        return next(self.docs)
+
+    def close(self):
+        self.closed = True
+
+
+def get_collection(cursor):
+    collection = mock.Mock()
+    collection.aggregate.return_value = cursor
+    return ProfiledCollection(collection, QueryProfiler(threshold_ms=10000))
+
+
+def get_stats(collection):
+    return collection._ProfiledCollection__profiler.summary()
+
+
+def test_aggregate_recorded_when_the_cursor_is_exhausted():
+    collection = get_collection(FakeCommandCursor([{'a': 1}, {'a': 2}, {'a': 3}], secs_per_doc=0.01))
+    cursor = collection.aggregate([{'$match': {}}])
+    assert get_stats(collection) == []
+    assert [doc['a'] for doc in cursor] == [1, 2, 3]
+    stats, = get_stats(collection)
+    assert stats['operation'] == 'aggregate'
+    assert stats['calls'] == 1
+    assert stats['docs_returned'] == 3
+    assert stats['total_secs'] >= 0.03
+
+
+def test_aggregate_recorded_when_the_cursor_is_closed():
+    fake_cursor = FakeCommandCursor([{'a': 1}, {'a': 2}])
+    collection = get_collection(fake_cursor)
+    with collection.aggregate([{'$match': {}}]) as cursor:
+        next(cursor)
+    assert fake_cursor.closed
+    stats, = get_stats(collection)
+    assert stats['calls'] == 1
+    assert stats['docs_returned'] == 1
@@ -0,0 +1,13 @@
+from datetime import date
+
+from src.utils.snapshot_exporter import UNKNOWN_PARTITION, get_partition_value
+
+
+def test_partition_values():
+    assert get_partition_value('anr') == 'anr'
+    assert get_partition_value(date(2018, 4, 18)) == '2018-04-18'
+
+
+def test_unknown_partition_values():
+    for value in [None, '', -1, '-1', 'desconocido', 'Desconocido']:
+        assert get_partition_value(value) == UNKNOWN_PARTITION
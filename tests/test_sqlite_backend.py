@@ -0,0 +1,26 @@
+import pytest
+
+from src.utils.sqlite_backend import SQLiteDatabase
+
+
+@pytest.fixture
+def collection(tmp_path):
+    collection = SQLiteDatabase(tmp_path.joinpath('db.sqlite'))['tweets']
+    collection.insert_many([{'i': i, 'tags': ['a', 'b'] if i % 2 else 'a'} for i in range(10)])
+    return collection
+
+
+def test_pages_sorted_by_id(collection):
+    first = list(collection.find({}).sort('_id', 1).limit(4))
+    second = list(collection.find({'$and': [{}, {'_id': {'$gt': first[-1]['_id']}}]}).sort('_id', 1).limit(4))
+    assert [doc['i'] for doc in first + second] == list(range(8))
+    assert [doc['i'] for doc in collection.find({}).sort('_id', -1).skip(1).limit(2)] == [8, 7]
+    assert collection.find({})[5]['i'] == 5
+
+
+def test_skip_and_limit_of_queries_checked_in_python(collection):
+    assert [doc['i'] for doc in collection.find({'i': {'$gte': 2}}).skip(3).limit(2)] == [5, 6]
+    collection.create_index('tags')
+    # arrays are matched by element
+    assert [doc['i'] for doc in collection.find({'tags': 'b'}).skip(1).limit(2)] == [3, 5]
+    assert [doc['i'] for doc in collection.find({}).sort('i', -1).skip(1).limit(1)] == [8]
@@ -0,0 +1,93 @@
+from unittest import mock
+
+import pytest
+
+from src.tweet_collector.collection_metrics import CollectionMetrics
+from src.tweet_collector.tweet_id_filter import TweetIdFilter
+from src.tweet_collector.twitter_api_manager import TwitterAPIManager
+
+
+class FakeTweet:
+    def __init__(self, id_str):
+        self._json = {'id_str': id_str, 'user': {'screen_name': 'user'}}
+
+
+@pytest.fixture
+def db():
+    db = mock.Mock()
+    db.create_tweet_record.side_effect = lambda tweet, *args: {'tweet_obj': tweet}
+    db.add_tweets.side_effect = lambda records: (len(records), 0)
+    db.add_tweet.return_value = True
+    return db
+
+
+@pytest.fixture
+def catalog():
+    catalog = mock.Mock()
+    catalog.flag_tweet.return_value = {}
+    return catalog
+
+
+def get_manager(db, batch_size=0, id_filter=None):
+    with mock.patch('src.tweet_collector.twitter_api_manager.TweetEvaluator'), \
+            mock.patch('src.tweet_collector.twitter_api_manager.tweepy'):
+        manager = TwitterAPIManager({'key': 'key', 'secret': 'secret'}, db, batch_size=batch_size,
+                                    metrics=CollectionMetrics(), id_filter=id_filter)
+    # metrics of the keyword being searched, set by search_tweets
+    keyword_metrics = manager.metrics.start_keyword('keyword')
+    manager._TwitterAPIManager__keyword_metrics = keyword_metrics
+    return manager, keyword_metrics
+
+
+def test_buffered_flush(db, catalog):
+    manager, keyword_metrics = get_manager(db, batch_size=2)
+    manager.process_and_store(FakeTweet('1'), 'hashtag', catalog)
+    db.add_tweets.assert_not_called()
+    manager.process_and_store(FakeTweet('2'), 'hashtag', catalog)
+    db.add_tweets.assert_called_once()
+    assert len(db.add_tweets.call_args[0][0]) == 2
+    assert keyword_metrics.db_writes == 1
+    assert keyword_metrics.inserted == 2
+    assert keyword_metrics.max_batch_size == 2
+    assert manager.inserted_tweets == 2
+
+
+def test_unbuffered_write(db, catalog):
+    manager, keyword_metrics = get_manager(db)
+    manager.process_and_store(FakeTweet('1'), 'hashtag', catalog)
+    db.add_tweet.assert_called_once()
+    assert keyword_metrics.db_writes == 1
+    assert keyword_metrics.inserted == 1
+    assert keyword_metrics.duplicated == 0
+
+
+def test_unbuffered_write_with_filter(db, catalog):
+    manager, keyword_metrics = get_manager(db, id_filter=TweetIdFilter())
+    manager.process_and_store(FakeTweet('1'), 'hashtag', catalog)
+    manager.process_and_store(FakeTweet('1'), 'hashtag', catalog)
+    db.add_tweets.assert_called_once()
+    assert keyword_metrics.inserted == 1
+    assert keyword_metrics.filtered == 1
+
+
+def test_ids_are_added_to_the_filter_after_the_flush(db, catalog):
+    id_filter = TweetIdFilter()
+    manager, keyword_metrics = get_manager(db, batch_size=3, id_filter=id_filter)
+    manager.process_and_store(FakeTweet('1'), 'hashtag', catalog)
+    # the buffered tweet is not in the filter yet but it isn't buffered twice
+    manager.process_and_store(FakeTweet('1'), 'hashtag', catalog)
+    assert '1' not in id_filter
+    assert keyword_metrics.filtered == 1
+    manager.flush()
+    assert len(db.add_tweets.call_args[0][0]) == 1
+    assert '1' in id_filter
+
+
+def test_failed_flush_does_not_add_ids_to_the_filter(db, catalog):
+    db.add_tweets.side_effect = RuntimeError('write failed')
+    id_filter = TweetIdFilter()
+    manager, keyword_metrics = get_manager(db, batch_size=1, id_filter=id_filter)
+    with pytest.raises(RuntimeError):
+        manager.process_and_store(FakeTweet('1'), 'hashtag', catalog)
+    assert '1' not in id_filter
+    assert keyword_metrics.db_writes == 0